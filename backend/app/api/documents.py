@@ -3,19 +3,29 @@
 提供 PDF、Word、CAD、BIM 文件的上传和解析功能
 """
 import os
-import json
-import aiofiles
+import re
+import glob
+import orjson
+import time
+import uuid
+import shutil
+import asyncio
+import threading
+from contextlib import asynccontextmanager, suppress
+from collections import Counter
+from operator import attrgetter, itemgetter
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 import logging
 from datetime import datetime
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, BackgroundTasks
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, BackgroundTasks, Request
+from fastapi.responses import Response
+from pydantic import BaseModel, TypeAdapter
 
 from ..core.config import get_settings
 from ..utils.pdf_parser import parse_pdf_file, PDFContent
+from ..utils.http_cache import etag_json_response
 from ..services.graphiti_service import get_graphiti_service, KnowledgeGraphResult
 
 logger = logging.getLogger(__name__)
@@ -23,9 +33,19 @@ settings = get_settings()
 
 router = APIRouter()
 
-# 文档数据存储文件路径
+# 文档元数据存储目录：每个文档一个 JSON 文件，更新单个文档只需重写一个小文件
+DOCUMENTS_META_DIR = os.path.join(settings.UPLOAD_DIR, "_meta")
+
+# 旧版单文件文档数据库路径，仅用于迁移到 DOCUMENTS_META_DIR
 DOCUMENTS_DB_PATH = os.path.join(settings.UPLOAD_DIR, "documents_db.json")
 
+# 各类文档的上传子目录（启动时计算一次）；删除时额外清理 temp
+DOCUMENT_SUBDIRS = tuple(os.path.join(settings.UPLOAD_DIR, subdir) for subdir in ("pdf", "doc", "cad", "bim"))
+UPLOAD_SUBDIRS = DOCUMENT_SUBDIRS + (os.path.join(settings.UPLOAD_DIR, "temp"),)
+
+# 上传文件写盘时每次读取的块大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 # 响应模型
 class FileUploadResponse(BaseModel):
     """文件上传响应"""
@@ -66,75 +86,245 @@ class DocumentInfo(BaseModel):
     processed_at: Optional[datetime] = None
     node_count: int = 0
     error_message: Optional[str] = None
+    storage_path: Optional[str] = None  # 上传文件在磁盘上的实际路径
+
+
+# 旧版文档数据库的校验器（迁移时使用）
+_DOCUMENTS_ADAPTER = TypeAdapter(Dict[str, DocumentInfo])
+
+# 文档数据库的进程内缓存，按元数据目录的 mtime 失效
+_DB_CACHE: Dict[str, Any] = {"mtime": None, "data": {}}
+_DB_LOCK = threading.Lock()
+
+# 写回队列：已更新到缓存、尚未落盘的文档，由后台任务合并写入
+DOCUMENTS_FLUSH_INTERVAL = 0.1  # 秒
+_DIRTY_DOCUMENTS: Dict[str, DocumentInfo] = {}
+# 正在落盘的批次；落盘期间不持有 _DB_LOCK，读取方不会被磁盘 I/O 阻塞
+_FLUSHING_DOCUMENTS: Dict[str, DocumentInfo] = {}
+# 串行化所有落盘/删除元数据文件的操作（先于 _DB_LOCK 获取）
+_FLUSH_LOCK = threading.Lock()
+_flush_event: Optional[asyncio.Event] = None
+_flush_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _document_meta_path(file_id: str) -> str:
+    """单个文档元数据文件的路径"""
+    return os.path.join(DOCUMENTS_META_DIR, f"{file_id}.json")
+
+
+def _write_document_meta(doc_info: DocumentInfo):
+    """原子写入单个文档的元数据文件（调用方需保证没有并发写入）"""
+    path = _document_meta_path(doc_info.file_id)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(doc_info.model_dump_json(indent=2).encode('utf-8'))
+    os.replace(tmp_path, path)
+
+
+def _migrate_legacy_documents_db():
+    """将旧版 documents_db.json 拆分为每个文档一个元数据文件"""
+    with _DB_LOCK:
+        if not os.path.exists(DOCUMENTS_DB_PATH):
+            return  # 已被并发的加载调用迁移
+
+        with open(DOCUMENTS_DB_PATH, 'rb') as f:
+            documents = _DOCUMENTS_ADAPTER.validate_json(f.read())
+
+        os.makedirs(DOCUMENTS_META_DIR, exist_ok=True)
+        for doc_info in documents.values():
+            _write_document_meta(doc_info)
+        os.replace(DOCUMENTS_DB_PATH, f"{DOCUMENTS_DB_PATH}.migrated")
+    logger.info(f"已将 {len(documents)} 条文档记录迁移到 {DOCUMENTS_META_DIR}")
+
+
+def _cached_documents() -> Dict[str, DocumentInfo]:
+    """返回经 mtime 校验的缓存字典本身（仅供只读查找，调用方不得修改）"""
+    try:
+        mtime = os.stat(DOCUMENTS_META_DIR).st_mtime_ns
+    except FileNotFoundError:
+        if not os.path.exists(DOCUMENTS_DB_PATH):
+            return {}
+        _migrate_legacy_documents_db()
+        mtime = os.stat(DOCUMENTS_META_DIR).st_mtime_ns
+
+    # 缓存命中时无需加锁（重新加载时先替换 data 再更新 mtime）
+    if _DB_CACHE["mtime"] == mtime:
+        return _DB_CACHE["data"]
+
+    with _DB_LOCK:
+        if _DB_CACHE["mtime"] != mtime:
+            documents = {}
+            with os.scandir(DOCUMENTS_META_DIR) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(".json"):
+                        continue
+                    try:
+                        with open(entry.path, 'rb') as f:
+                            doc_info = DocumentInfo.model_validate_json(f.read())
+                    except FileNotFoundError:
+                        continue  # 扫描期间被删除
+                    except Exception as e:
+                        logger.error(f"读取文档元数据失败 {entry.name}: {e}")
+                        continue
+                    documents[doc_info.file_id] = doc_info
+            # 尚未落盘（或正在落盘）的更新优先于磁盘上的旧记录
+            documents.update(_FLUSHING_DOCUMENTS)
+            documents.update(_DIRTY_DOCUMENTS)
+            _DB_CACHE["data"] = documents
+            _DB_CACHE["mtime"] = mtime
+        return _DB_CACHE["data"]
 
 
 def load_documents_db() -> Dict[str, DocumentInfo]:
-    """加载文档数据库"""
+    """加载文档数据库（元数据目录未变化时直接返回缓存）"""
     try:
-        if os.path.exists(DOCUMENTS_DB_PATH):
-            with open(DOCUMENTS_DB_PATH, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # 转换为DocumentInfo对象
-                documents = {}
-                for file_id, doc_data in data.items():
-                    # 处理datetime字段
-                    if doc_data.get('upload_time') and isinstance(doc_data['upload_time'], str):
-                        doc_data['upload_time'] = datetime.fromisoformat(doc_data['upload_time'].replace('Z', '+00:00'))
-                    if doc_data.get('processed_at') and isinstance(doc_data['processed_at'], str):
-                        doc_data['processed_at'] = datetime.fromisoformat(doc_data['processed_at'].replace('Z', '+00:00'))
-                    
-                    documents[file_id] = DocumentInfo(**doc_data)
-                return documents
-        return {}
+        # 返回浅拷贝，调用方增删条目不会污染缓存
+        return dict(_cached_documents())
     except Exception as e:
         logger.error(f"加载文档数据库失败: {e}")
         return {}
 
 
-def save_documents_db(documents: Dict[str, DocumentInfo]):
-    """保存文档数据库"""
+def _flush_dirty_documents():
+    """将写回队列中的文档元数据落盘"""
+    with _FLUSH_LOCK:
+        try:
+            with _DB_LOCK:
+                if not _DIRTY_DOCUMENTS:
+                    return
+                cache_was_current = _DB_CACHE["mtime"] == os.stat(DOCUMENTS_META_DIR).st_mtime_ns
+                _FLUSHING_DOCUMENTS.update(_DIRTY_DOCUMENTS)
+                _DIRTY_DOCUMENTS.clear()
+
+            for doc_info in _FLUSHING_DOCUMENTS.values():
+                _write_document_meta(doc_info)
+
+            with _DB_LOCK:
+                _FLUSHING_DOCUMENTS.clear()
+                # 缓存已包含这些更新，落盘后无需重新扫描目录
+                if cache_was_current:
+                    _DB_CACHE["mtime"] = os.stat(DOCUMENTS_META_DIR).st_mtime_ns
+        except Exception as e:
+            logger.error(f"写入文档信息失败: {e}")
+            # 未写成功的记录放回写回队列，等待下次重试（不覆盖更新的版本）
+            with _DB_LOCK:
+                for file_id, doc_info in _FLUSHING_DOCUMENTS.items():
+                    _DIRTY_DOCUMENTS.setdefault(file_id, doc_info)
+                _FLUSHING_DOCUMENTS.clear()
+
+
+async def documents_db_writer():
+    """后台写回任务：合并短时间内的多次文档更新，批量落盘"""
+    global _flush_event, _flush_loop
+    _flush_loop = asyncio.get_running_loop()
+    _flush_event = asyncio.Event()
     try:
-        # 确保目录存在
-        os.makedirs(os.path.dirname(DOCUMENTS_DB_PATH), exist_ok=True)
-        
-        # 转换为可序列化的字典
-        data = {}
-        for file_id, doc_info in documents.items():
-            doc_dict = doc_info.model_dump()
-            # 转换datetime为ISO字符串
-            if doc_dict.get('upload_time'):
-                doc_dict['upload_time'] = doc_dict['upload_time'].isoformat()
-            if doc_dict.get('processed_at'):
-                doc_dict['processed_at'] = doc_dict['processed_at'].isoformat()
-            data[file_id] = doc_dict
-        
-        with open(DOCUMENTS_DB_PATH, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        while True:
+            await _flush_event.wait()
+            await asyncio.sleep(DOCUMENTS_FLUSH_INTERVAL)
+            _flush_event.clear()
+            await asyncio.to_thread(_flush_dirty_documents)
+    finally:
+        _flush_event = None
+        _flush_loop = None
+        # 关闭时写入剩余的更新
+        _flush_dirty_documents()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """文档模块的生命周期：运行期间启动元数据写回任务"""
+    writer = asyncio.create_task(documents_db_writer())
+    try:
+        yield
+    finally:
+        writer.cancel()
+        with suppress(asyncio.CancelledError):
+            await writer
+
+
+def save_document_info(doc_info: DocumentInfo):
+    """保存单个文档的信息：立即更新缓存，由后台写回任务落盘"""
+    try:
+        os.makedirs(DOCUMENTS_META_DIR, exist_ok=True)
+
+        with _DB_LOCK:
+            _DB_CACHE["data"][doc_info.file_id] = doc_info
+            _DIRTY_DOCUMENTS[doc_info.file_id] = doc_info
     except Exception as e:
-        logger.error(f"保存文档数据库失败: {e}")
+        logger.error(f"保存文档信息失败 {doc_info.file_id}: {e}")
+        return
 
+    loop, event = _flush_loop, _flush_event
+    if loop is None or event is None or loop.is_closed():
+        # 写回任务未运行（如脚本中直接调用），同步落盘
+        _flush_dirty_documents()
+    else:
+        loop.call_soon_threadsafe(event.set)
 
-def get_document_info(file_id: str) -> DocumentInfo:
-    """获取文档信息"""
-    documents = load_documents_db()
+
+def delete_document_info(file_id: str):
+    """删除单个文档的元数据文件"""
+    try:
+        with _FLUSH_LOCK, _DB_LOCK:
+            _DIRTY_DOCUMENTS.pop(file_id, None)
+            _DB_CACHE["data"].pop(file_id, None)
+            try:
+                cache_was_current = _DB_CACHE["mtime"] == os.stat(DOCUMENTS_META_DIR).st_mtime_ns
+                os.remove(_document_meta_path(file_id))
+            except FileNotFoundError:
+                return
+
+            if cache_was_current:
+                _DB_CACHE["mtime"] = os.stat(DOCUMENTS_META_DIR).st_mtime_ns
+    except Exception as e:
+        logger.error(f"删除文档信息失败 {file_id}: {e}")
+
+
+def get_document_info(file_id: str, documents: Optional[Dict[str, DocumentInfo]] = None) -> DocumentInfo:
+    """获取文档信息（可传入已加载的文档数据库以避免重复加载）"""
+    if documents is None:
+        # 单条查找直接读取缓存，无需复制整个字典
+        try:
+            documents = _cached_documents()
+        except Exception as e:
+            logger.error(f"加载文档数据库失败: {e}")
+            return None
     return documents.get(file_id)
 
 
-def update_document_status(file_id: str, status: str, **kwargs):
-    """更新文档状态"""
-    documents = load_documents_db()
+def update_document_status(
+    file_id: str,
+    status: str,
+    documents: Optional[Dict[str, DocumentInfo]] = None,
+    **kwargs
+):
+    """更新文档状态（可传入已加载的文档数据库以避免重复加载）"""
+    if documents is None:
+        documents = load_documents_db()
     if file_id in documents:
-        documents[file_id].status = status
+        doc_info = documents[file_id]
+        doc_info.status = status
         for key, value in kwargs.items():
-            if hasattr(documents[file_id], key):
-                setattr(documents[file_id], key, value)
-        save_documents_db(documents)
+            if hasattr(doc_info, key):
+                setattr(doc_info, key, value)
+        save_document_info(doc_info)
+
+
+# 统计时归类的文档状态
+PROCESSING_STATES = frozenset({"processing", "parsing", "building_graph", "processing_queued"})
+FAILED_STATES = frozenset({"failed", "error", "error_parsing", "error_kg_build"})
 
 
 # 全局状态存储 (简化实现，生产环境应使用 Redis 或数据库)
 processing_status: Dict[str, ProcessingStatus] = {}
 
 
+# 扩展名白名单的集合形式，用于 O(1) 成员判断；列表保留原顺序用于提示信息
+ALLOWED_EXTENSION_SET = frozenset(settings.ALLOWED_EXTENSIONS)
+ALLOWED_EXTENSIONS_TEXT = ', '.join(settings.ALLOWED_EXTENSIONS)
+
+
 def validate_file(file: UploadFile) -> None:
     """验证上传的文件"""
     # 检查文件大小
@@ -146,27 +336,35 @@ def validate_file(file: UploadFile) -> None:
     
     # 检查文件扩展名
     file_ext = Path(file.filename).suffix.lower()
-    if file_ext not in settings.ALLOWED_EXTENSIONS:
+    if file_ext not in ALLOWED_EXTENSION_SET:
         raise HTTPException(
             status_code=400,
-            detail=f"不支持的文件类型: {file_ext}。支持的类型: {', '.join(settings.ALLOWED_EXTENSIONS)}"
+            detail=f"不支持的文件类型: {file_ext}。支持的类型: {ALLOWED_EXTENSIONS_TEXT}"
         )
 
 
+# 文件扩展名 -> 文件类型
+FILE_TYPE_MAP = {
+    '.pdf': 'pdf',
+    '.doc': 'doc',
+    '.docx': 'doc',
+    '.dxf': 'cad',
+    '.dwg': 'cad',
+    '.ifc': 'bim'
+}
+
+
 def get_file_type(filename: str) -> str:
     """根据文件名获取文件类型"""
-    ext = Path(filename).suffix.lower()
-    
-    type_map = {
-        '.pdf': 'pdf',
-        '.doc': 'doc',
-        '.docx': 'doc', 
-        '.dxf': 'cad',
-        '.dwg': 'cad',
-        '.ifc': 'bim'
-    }
-    
-    return type_map.get(ext, 'unknown')
+    return FILE_TYPE_MAP.get(os.path.splitext(filename)[1].lower(), 'unknown')
+
+
+def _save_upload_file(file: UploadFile, file_path: str) -> int:
+    """将上传文件分块复制到磁盘，返回写入的字节数"""
+    file.file.seek(0)
+    with open(file_path, 'wb') as f:
+        shutil.copyfileobj(file.file, f, UPLOAD_CHUNK_SIZE)
+        return f.tell()
 
 
 @router.post("/upload", response_model=FileUploadResponse)
@@ -185,8 +383,7 @@ async def upload_file(file: UploadFile = File(...)):
         validate_file(file)
         
         # 生成文件ID
-        import uuid
-        file_id = str(uuid.uuid4())
+        file_id = uuid.uuid4().hex
         
         # 确定文件类型和存储路径
         file_type = get_file_type(file.filename)
@@ -197,25 +394,22 @@ async def upload_file(file: UploadFile = File(...)):
         safe_filename = f"{file_id}_{file.filename}"
         file_path = os.path.join(storage_dir, safe_filename)
         
-        # 保存文件
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
+        # 分块保存文件，整个写盘过程只占用一次线程池调度
+        file_size = await asyncio.to_thread(_save_upload_file, file, file_path)
         
         # 创建文档信息并保存到持久化存储
         doc_info = DocumentInfo(
             file_id=file_id,
             filename=file.filename,
             file_type=file_type,
-            file_size=len(content),
+            file_size=file_size,
             upload_time=datetime.now(),
-            status="uploaded"
+            status="uploaded",
+            storage_path=file_path
         )
         
         # 保存到持久化数据库
-        documents = load_documents_db()
-        documents[file_id] = doc_info
-        save_documents_db(documents)
+        save_document_info(doc_info)
         
         # 记录处理状态
         processing_status[file_id] = ProcessingStatus(
@@ -231,7 +425,7 @@ async def upload_file(file: UploadFile = File(...)):
             success=True,
             file_id=file_id,
             filename=file.filename,
-            file_size=len(content),
+            file_size=file_size,
             file_type=file_type,
             message="文件上传成功"
         )
@@ -244,16 +438,23 @@ async def upload_file(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail="服务器内部错误，文件上传失败。请稍后重试或联系管理员。")
 
 
-def find_file_by_id(file_id: str) -> tuple[str, str] | None:
+def find_file_by_id(
+    file_id: str,
+    documents: Optional[Dict[str, DocumentInfo]] = None
+) -> tuple[str, str] | None:
     """根据文件ID查找文件路径和原始文件名"""
-    for subdir in ["pdf", "doc", "cad", "bim"]:
-        search_dir = os.path.join(settings.UPLOAD_DIR, subdir)
-        if os.path.exists(search_dir):
-            for f in os.listdir(search_dir):
-                if f.startswith(file_id + "_"):
-                    file_path = os.path.join(search_dir, f)
-                    filename = f[len(file_id) + 1:]  # 移除 file_id 前缀
-                    return file_path, filename
+    # 优先使用上传时记录的存储路径
+    doc_info = get_document_info(file_id, documents)
+    if doc_info and doc_info.storage_path and os.path.exists(doc_info.storage_path):
+        return doc_info.storage_path, doc_info.filename
+
+    # 兼容没有记录存储路径的旧文档：扫描上传目录
+    pattern = f"{glob.escape(file_id)}_*"
+    for subdir in DOCUMENT_SUBDIRS:
+        hit = next(Path(subdir).glob(pattern), None)
+        if hit is not None:
+            filename = hit.name[len(file_id) + 1:]  # 移除 file_id 前缀
+            return str(hit), filename
     return None
 
 
@@ -269,31 +470,31 @@ async def get_processing_status(file_id: str):
         doc_info = documents[file_id]
 
         # 根据文档状态计算进度和消息
-    progress_map = {
-        "uploaded": 0,
-        "processing": 50,
-        "completed": 100,
-        "failed": 100
-    }
-    
-    message_map = {
-        "uploaded": "文件已上传，等待处理",
-        "processing": "正在处理文档...",
-        "completed": "文档处理完成",
-        "failed": f"处理失败: {doc_info.error_message or '未知错误'}"
-    }
+        progress_map = {
+            "uploaded": 0,
+            "processing": 50,
+            "completed": 100,
+            "failed": 100
+        }
     
-    return ProcessingStatus(
-        file_id=file_id,
-        status=doc_info.status,
-        progress=progress_map.get(doc_info.status, 0),
-        message=message_map.get(doc_info.status, "未知状态"),
-        result={
-            "node_count": doc_info.node_count,
-            "processed_at": doc_info.processed_at.isoformat() if doc_info.processed_at else None,
-            "error_message": doc_info.error_message
+        message_map = {
+            "uploaded": "文件已上传，等待处理",
+            "processing": "正在处理文档...",
+            "completed": "文档处理完成",
+            "failed": f"处理失败: {doc_info.error_message or '未知错误'}"
         }
-    )
+    
+        return ProcessingStatus(
+            file_id=file_id,
+            status=doc_info.status,
+            progress=progress_map.get(doc_info.status, 0),
+            message=message_map.get(doc_info.status, "未知状态"),
+            result={
+                "node_count": doc_info.node_count,
+                "processed_at": doc_info.processed_at.isoformat() if doc_info.processed_at else None,
+                "error_message": doc_info.error_message
+            }
+        )
     except HTTPException as http_exc:
         # This will be caught by the global exception handler if not handled here,
         # but explicit logging can be useful.
@@ -304,20 +505,68 @@ async def get_processing_status(file_id: str):
         raise HTTPException(status_code=500, detail="服务器内部错误，获取状态失败。")
 
 
-async def _parse_document_internal(file_id: str, enable_ocr: bool = True):
-    """内部解析函数，返回原始数据而不是JSONResponse"""
+# 清理字符串时需要删除的字符：除 \t \n \r 外的 ASCII 控制字符及 DEL。
+# 可打印 ASCII 与所有非 ASCII 字符（含 CJK 及全角符号）均保留。
+_CONTROL_CHARS_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+
+
+def ultra_clean_string(s: Any) -> str:
+    """清理字符串中的控制字符，使其可安全序列化为 JSON"""
+    if not isinstance(s, str):
+        return str(s) if s is not None else ""
+    # 快速路径：可打印字符串（元数据、表格单元格的常见情况）不含控制字符，无需正则替换
+    if s.isprintable():
+        return s.strip()
+    return _CONTROL_CHARS_RE.sub('', s).strip()
+
+
+def deep_clean_data(obj: Any) -> Any:
+    """清理 dict/list 中的所有字符串（迭代遍历并原地修改，不重建容器）"""
+    if isinstance(obj, str):
+        return ultra_clean_string(obj)
+
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, dict):
+            for key in list(current):
+                value = current[key]
+                if isinstance(value, str):
+                    value = ultra_clean_string(value)
+                elif isinstance(value, (dict, list)):
+                    stack.append(value)
+                clean_key = ultra_clean_string(str(key))
+                if clean_key != key:
+                    del current[key]
+                current[clean_key] = value
+        elif isinstance(current, list):
+            for i, value in enumerate(current):
+                if isinstance(value, str):
+                    current[i] = ultra_clean_string(value)
+                elif isinstance(value, (dict, list)):
+                    stack.append(value)
+    return obj # Non-string, non-dict, non-list values are kept as is
+
+
+async def _parse_document_internal(
+    file_id: str,
+    enable_ocr: bool = True,
+    documents: Optional[Dict[str, DocumentInfo]] = None
+):
+    """内部解析函数，返回原始数据而不是响应对象"""
     # This is an internal helper, so direct exception handling might be less critical
     # if the calling function handles them. However, adding some for robustness.
     try:
+        # 查找文件（只查找一次，恢复状态与解析共用结果）
+        file_info_tuple = find_file_by_id(file_id, documents)
+
         # 检查文件ID，如果内存中没有则尝试恢复
         if file_id not in processing_status:
-            file_info_tuple = find_file_by_id(file_id) # Renamed to avoid conflict
             if file_info_tuple is None:
                 logger.error(f"File ID {file_id} not found by find_file_by_id in _parse_document_internal.")
                 raise HTTPException(status_code=404, detail="文件ID不存在 (internal find failed)")
             
             # 重建处理状态
-            file_path, filename = file_info_tuple
             processing_status[file_id] = ProcessingStatus(
                 file_id=file_id,
                 status="uploaded", # Or "unknown_recovered"
@@ -330,15 +579,13 @@ async def _parse_document_internal(file_id: str, enable_ocr: bool = True):
         processing_status[file_id].progress = 10
         processing_status[file_id].message = "正在解析文档..."
         
-        # 查找文件
-        file_info_tuple_lookup = find_file_by_id(file_id) # Renamed
-        if file_info_tuple_lookup is None:
+        if file_info_tuple is None:
             processing_status[file_id].status = "error"
             processing_status[file_id].message = "文件物理路径未找到"
             logger.error(f"Physical file for ID {file_id} not found during parsing attempt.")
             raise HTTPException(status_code=404, detail="文件物理路径未找到")
         
-        file_path, filename = file_info_tuple_lookup
+        file_path, filename = file_info_tuple
         
         # 更新进度
         processing_status[file_id].progress = 30
@@ -347,39 +594,10 @@ async def _parse_document_internal(file_id: str, enable_ocr: bool = True):
         file_type = get_file_type(filename)
         
         if file_type == "pdf":
-            from ..utils.pdf_parser import parse_pdf_file
-            
-            # 解析PDF文件
-            pdf_content = parse_pdf_file(file_path, enable_ocr=enable_ocr)
+            # 解析PDF文件（CPU 密集，放到线程池执行，避免阻塞事件循环）
+            pdf_content = await asyncio.to_thread(parse_pdf_file, file_path, enable_ocr=enable_ocr)
             
             # 转换为JSON可序列化的格式
-            def ultra_clean_string(s):
-                if not isinstance(s, str):
-                    return str(s) if s is not None else ""
-
-                cleaned = ""
-                for char in s:
-                    code = ord(char)
-                    # Allow basic printable ASCII, common whitespace, and CJK Unified Ideographs
-                    if (32 <= code <= 126) or char in '\n\r\t' or \
-                       (0x4e00 <= code <= 0x9fff) or \
-                       (0x3000 <= code <= 0x303f) or \
-                       (0xff00 <= code <= 0xffef): # Added CJK Symbols/Punctuation and Fullwidth forms
-                        cleaned += char
-                    elif code > 127: # Keep other Unicode characters too for now
-                        cleaned += char
-                return cleaned.strip()
-
-            def deep_clean_data(obj):
-                if isinstance(obj, dict):
-                    return {ultra_clean_string(str(k)): deep_clean_data(v) for k, v in obj.items()}
-                elif isinstance(obj, list):
-                    return [deep_clean_data(item) for item in obj]
-                elif isinstance(obj, str):
-                    return ultra_clean_string(obj)
-                else:
-                    return obj # Keep non-string, non-dict, non-list as is
-
             content_dict = {
                 "text": ultra_clean_string(pdf_content.text),
                 "page_count": pdf_content.page_count,
@@ -399,10 +617,19 @@ async def _parse_document_internal(file_id: str, enable_ocr: bool = True):
             #     "processing_time": 0.0
             # }
 
+            # 解析结果摘要只计算一次，状态记录直接复用
+            content_summary = {
+                "page_count": content_dict["page_count"],
+                "text_length": len(content_dict["text"]),
+                "num_images": len(content_dict["images"]),
+                "num_tables": len(content_dict["tables"]),
+            }
+
             return {
                 "success": True,
                 "file_id": file_id,
                 "content": content_dict, # This is the PDFContent model data, not yet JSON
+                "summary": content_summary,
                 "message": "PDF 解析完成"
             }
             
@@ -437,7 +664,9 @@ async def parse_document(file_id: str, enable_ocr: bool = True):
     start_time = datetime.now()
     try:
         # Initial status check and setup (simplified from original as _parse_document_internal handles some of this)
-        doc_info_db = get_document_info(file_id)
+        # 解析前的检查共用一次加载的文档数据库；解析耗时较长，解析后的状态更新重新读取，避免写回已删除的文档
+        documents = load_documents_db()
+        doc_info_db = get_document_info(file_id, documents)
         if not doc_info_db:
             logger.warning(f"Parse requested for non-existent file_id in DB: {file_id}")
             raise HTTPException(status_code=404, detail="文件ID在数据库中不存在")
@@ -452,7 +681,7 @@ async def parse_document(file_id: str, enable_ocr: bool = True):
         processing_status[file_id].message = "正在解析文档..."
 
         # Call internal parsing logic
-        parsed_data = await _parse_document_internal(file_id, enable_ocr)
+        parsed_data = await _parse_document_internal(file_id, enable_ocr, documents)
 
         processing_time_seconds = (datetime.now() - start_time).total_seconds()
         
@@ -462,12 +691,7 @@ async def parse_document(file_id: str, enable_ocr: bool = True):
         processing_status[file_id].message = "文档解析成功完成"
         # parsed_data["content"] is already a dict from _parse_document_internal
         processing_status[file_id].result = {
-            "content_summary": {
-                "page_count": parsed_data["content"]["page_count"],
-                "text_length": len(parsed_data["content"]["text"]),
-                "num_images": len(parsed_data["content"]["images"]),
-                "num_tables": len(parsed_data["content"]["tables"]),
-            },
+            "content_summary": parsed_data["summary"],
             "processing_time": processing_time_seconds
         }
 
@@ -484,7 +708,8 @@ async def parse_document(file_id: str, enable_ocr: bool = True):
             "processing_time": processing_time_seconds,
             "message": "文档解析成功完成"
         }
-        return JSONResponse(content=final_response_content) # Ensure it's JSON serializable
+        # 直接用 orjson 编码一次，跳过 jsonable_encoder 遍历与标准库 json 的二次编码
+        return Response(content=orjson.dumps(final_response_content), media_type="application/json")
 
     except HTTPException as http_exc:
         logger.warning(f"HTTPException during parsing for file_id '{file_id}': {http_exc.detail}")
@@ -596,8 +821,7 @@ async def process_document(
         # 更新状态为处理中
         doc_info.status = "processing"
         doc_info.processed_at = datetime.now()
-        docs_db[file_id] = doc_info
-        save_documents_db(docs_db)
+        save_document_info(doc_info)
         
         logger.info(f"🚀 开始处理文档: {doc_info.filename} (ID: {file_id})")
         
@@ -639,8 +863,7 @@ async def process_document_background(file_id: str, doc_info: Dict[str, Any]):
                 doc_info = docs_db[file_id]
                 doc_info.status = "failed"
                 doc_info.error_message = "文件不存在"
-                docs_db[file_id] = doc_info
-                save_documents_db(docs_db)
+                save_document_info(doc_info)
             return
         
         file_path, original_filename = file_info
@@ -658,8 +881,7 @@ async def process_document_background(file_id: str, doc_info: Dict[str, Any]):
                 doc_info_obj = docs_db[file_id]
                 doc_info_obj.status = "failed"
                 doc_info_obj.error_message = f"不支持的文件类型: {doc_info['file_type']}"
-                docs_db[file_id] = doc_info_obj
-                save_documents_db(docs_db)
+                save_document_info(doc_info_obj)
             
     except Exception as e:
         logger.error(f"❌ 后台处理文档失败: {e}")
@@ -669,17 +891,18 @@ async def process_document_background(file_id: str, doc_info: Dict[str, Any]):
             doc_info = docs_db[file_id]
             doc_info.status = "failed"
             doc_info.error_message = str(e)
-            docs_db[file_id] = doc_info
-            save_documents_db(docs_db)
+            save_document_info(doc_info)
 
 async def process_pdf_document(file_id: str, file_path: str, doc_info: Dict[str, Any]):
     """处理PDF文档"""
     try:
         logger.info(f"📖 解析PDF文档: {doc_info['filename']}")
         
-        # 解析PDF
-        from ..utils.pdf_parser import parse_pdf_file
-        pdf_content = parse_pdf_file(file_path, enable_ocr=True)
+        # 在线程池中解析PDF（不阻塞事件循环），同时获取 Graphiti 服务
+        pdf_content, graphiti_service = await asyncio.gather(
+            asyncio.to_thread(parse_pdf_file, file_path, enable_ocr=True),
+            asyncio.to_thread(get_graphiti_service)
+        )
         
         if not pdf_content or not pdf_content.text.strip():
             logger.warning(f"⚠️ PDF文档无文本内容: {doc_info['filename']}")
@@ -689,24 +912,23 @@ async def process_pdf_document(file_id: str, file_path: str, doc_info: Dict[str,
             doc_info.status = "completed"
             doc_info.node_count = 0
             doc_info.error_message = "文档无文本内容"
-            docs_db[file_id] = doc_info
-            save_documents_db(docs_db)
+            save_document_info(doc_info)
             return
         
-        logger.info(f"✅ PDF解析完成，文本长度: {len(pdf_content.text)} 字符")
+        # 构建图谱只需要文本，提前释放图片/表格等解析结构，避免在 LLM 调用期间常驻内存
+        text = pdf_content.text
+        del pdf_content
+
+        logger.info(f"✅ PDF解析完成，文本长度: {len(text)} 字符")
         
         # 构建知识图谱
         logger.info(f"🕸️ 开始构建知识图谱...")
         
-        from ..services.graphiti_service import get_graphiti_service
-        
-        # 使用新的Graphiti服务
-        graphiti_service = get_graphiti_service()
         if graphiti_service is None:
             raise Exception("Graphiti服务未初始化")
             
         result = await graphiti_service.build_knowledge_graph(
-            text=pdf_content.text,
+            text=text,
             document_id=file_id
         )
         
@@ -723,8 +945,7 @@ async def process_pdf_document(file_id: str, file_path: str, doc_info: Dict[str,
         else:
             logger.info(f"✅ 知识图谱构建成功，节点数: {result.get('node_count', 0)}")
         
-        docs_db[file_id] = doc_info
-        save_documents_db(docs_db)
+        save_document_info(doc_info)
         
     except Exception as e:
         logger.error(f"❌ PDF文档处理失败: {e}")
@@ -734,8 +955,7 @@ async def process_pdf_document(file_id: str, file_path: str, doc_info: Dict[str,
             doc_info = docs_db[file_id]
             doc_info.status = "failed"
             doc_info.error_message = str(e)
-            docs_db[file_id] = doc_info
-            save_documents_db(docs_db)
+            save_document_info(doc_info)
 
 async def process_cad_bim_document(file_id: str, file_path: str, doc_info: Dict[str, Any]):
     """处理CAD/BIM文档"""
@@ -751,8 +971,7 @@ async def process_cad_bim_document(file_id: str, file_path: str, doc_info: Dict[
         doc_info.processed_at = datetime.now()
         doc_info.node_count = 0
         doc_info.error_message = "CAD/BIM文件处理功能待实现"
-        docs_db[file_id] = doc_info
-        save_documents_db(docs_db)
+        save_document_info(doc_info)
         
         logger.info(f"⚠️ CAD/BIM文档处理完成（功能待实现）")
         
@@ -764,12 +983,12 @@ async def process_cad_bim_document(file_id: str, file_path: str, doc_info: Dict[
             doc_info = docs_db[file_id]
             doc_info.status = "failed"
             doc_info.error_message = str(e)
-            docs_db[file_id] = doc_info
-            save_documents_db(docs_db)
+            save_document_info(doc_info)
 
 
 @router.get("/list")
-async def list_uploaded_files():
+@router.head("/list", include_in_schema=False)  # 轮询时用于检查 ETag，不单独出现在 OpenAPI 文档中
+async def list_uploaded_files(request: Request):
     """列出已上传的文件"""
     try:
         # 从持久化存储中读取文档信息
@@ -778,9 +997,8 @@ async def list_uploaded_files():
         
         for file_id, doc_info in documents.items():
             # 获取当前处理状态
-            current_status = doc_info.status
-            if file_id in processing_status:
-                current_status = processing_status[file_id].status
+            live_status = processing_status.get(file_id)
+            current_status = live_status.status if live_status is not None else doc_info.status
             
             # 转换为API响应格式
             file_data = {
@@ -788,25 +1006,80 @@ async def list_uploaded_files():
                 "filename": doc_info.filename,
                 "file_type": doc_info.file_type,
                 "file_size": doc_info.file_size,
-                "upload_time": doc_info.upload_time.timestamp() if isinstance(doc_info.upload_time, datetime) else doc_info.upload_time,
+                "upload_time": doc_info.upload_time.timestamp(),
                 "status": current_status,
                 "node_count": doc_info.node_count,
-                "processed_at": doc_info.processed_at.timestamp() if doc_info.processed_at and isinstance(doc_info.processed_at, datetime) else None,
+                "processed_at": doc_info.processed_at.timestamp() if doc_info.processed_at else None,
                 "error_message": doc_info.error_message
             }
             
             files.append(file_data)
         
         # 按上传时间倒序排列
-        files.sort(key=lambda x: x["upload_time"], reverse=True)
+        files.sort(key=itemgetter("upload_time"), reverse=True)
         
-        return {"files": files}
+        # 列表未变化时返回 304，前端轮询无需重复传输和解析
+        return etag_json_response(request, {"files": files})
         
     except Exception as e:
         logger.error(f"获取文件列表失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取文件列表失败: {str(e)}")
 
 
+# 支持 unlinkat 的平台上按目录 fd 删除，避免每次删除都重新解析父目录路径
+_UNLINK_BY_DIR_FD = os.unlink in os.supports_dir_fd and os.scandir in os.supports_fd
+
+
+def _remove_file(path: str, dir_fd: Optional[int] = None, name: Optional[str] = None):
+    """删除单个文件，文件已不存在时只记录警告"""
+    try:
+        if dir_fd is None:
+            os.remove(path)
+        else:
+            os.unlink(name, dir_fd=dir_fd)
+        logger.info(f"删除文件: {path}")
+    except FileNotFoundError:
+        logger.warning(f"待删除的文件不存在: {path}")
+
+
+def _remove_prefixed_files(subdir: str, prefix: str):
+    """删除目录下以 prefix 开头的文件（阻塞调用）"""
+    if not _UNLINK_BY_DIR_FD:
+        try:
+            with os.scandir(subdir) as entries:
+                paths = [entry.path for entry in entries if entry.name.startswith(prefix)]
+        except FileNotFoundError:
+            return
+        for path in paths:
+            _remove_file(path)
+        return
+
+    try:
+        dir_fd = os.open(subdir, os.O_RDONLY | os.O_DIRECTORY)
+    except FileNotFoundError:
+        return
+    try:
+        with os.scandir(dir_fd) as entries:
+            names = [entry.name for entry in entries if entry.name.startswith(prefix)]
+        for name in names:
+            _remove_file(os.path.join(subdir, name), dir_fd, name)
+    finally:
+        os.close(dir_fd)
+
+
+def _remove_document_files(file_id: str, storage_path: Optional[str]):
+    """删除文档对应的上传文件（阻塞调用）"""
+    prefix = file_id + "_"
+    # 上传时记录了存储路径则直接删除，只需再清理 temp 中的残留文件
+    if storage_path:
+        _remove_file(storage_path)
+        _remove_prefixed_files(UPLOAD_SUBDIRS[-1], prefix)
+        return
+
+    for subdir in UPLOAD_SUBDIRS:
+        _remove_prefixed_files(subdir, prefix)
+
+
 @router.delete("/{file_id}")
 async def delete_file(file_id: str):
     """删除文件"""
@@ -816,22 +1089,11 @@ async def delete_file(file_id: str):
         if file_id not in documents:
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        deleted = False
-        
-        # 在各个目录中查找并删除文件
-        for subdir in ["pdf", "doc", "cad", "bim", "temp"]:
-            dir_path = os.path.join(settings.UPLOAD_DIR, subdir)
-            if os.path.exists(dir_path):
-                for filename in os.listdir(dir_path):
-                    if filename.startswith(file_id):
-                        file_path = os.path.join(dir_path, filename)
-                        os.remove(file_path)
-                        deleted = True
-                        logger.info(f"删除文件: {file_path}")
+        # 文件系统操作在线程池中执行，避免阻塞事件循环
+        await asyncio.to_thread(_remove_document_files, file_id, documents[file_id].storage_path)
         
         # 从持久化存储中删除文档信息
-        del documents[file_id]
-        save_documents_db(documents)
+        await asyncio.to_thread(delete_document_info, file_id)
         
         # 删除处理状态
         if file_id in processing_status:
@@ -846,31 +1108,69 @@ async def delete_file(file_id: str):
         raise HTTPException(status_code=500, detail=f"删除文件失败: {str(e)}")
 
 
+# 图谱统计需要查询 Neo4j，短时间内复用结果
+GRAPH_STATS_TTL = 30.0
+_GRAPH_STATS_CACHE: Dict[str, Any] = {"expires": 0.0, "data": None}
+
+
+async def _get_cached_graph_stats() -> Dict[str, Any]:
+    """获取知识图谱统计（带 TTL 缓存，只缓存成功的结果）"""
+    if _GRAPH_STATS_CACHE["data"] is not None and time.monotonic() < _GRAPH_STATS_CACHE["expires"]:
+        return _GRAPH_STATS_CACHE["data"]
+
+    # 服务单例已在应用启动时初始化，这里直接获取
+    service = get_graphiti_service()
+    if not service or not service.is_available():
+        return {"edge_count": 0, "status": "不可用"}
+
+    stats = await service.get_graph_stats()
+    # 查询出错时返回的错误信息不缓存，下次请求重新查询
+    if stats.get("status") == "正常":
+        _GRAPH_STATS_CACHE["data"] = stats
+        _GRAPH_STATS_CACHE["expires"] = time.monotonic() + GRAPH_STATS_TTL
+    return stats
+
+
 @router.get("/stats")
 async def get_document_stats():
     """获取文档统计信息 - 真实数据"""
     try:
-        documents = load_documents_db()
-        
-        total_documents = len(documents)
-        # Refined status checking for more accuracy
-        processed_documents = len([doc for doc in documents.values() if doc.status == "completed"])
-        processing_documents = len([doc for doc in documents.values() if doc.status in ["processing", "parsing", "building_graph", "processing_queued"]])
-        # Consider various failure states
-        failed_documents = len([doc for doc in documents.values() if "fail" in doc.status or "error" in doc.status])
-        
-        total_nodes = sum(doc.node_count for doc in documents.values() if isinstance(doc.node_count, int))
-        
-        file_types_counts = {}
-        for doc in documents.values():
-            file_types_counts[doc.file_type] = file_types_counts.get(doc.file_type, 0) + 1
+        # 图谱统计与本地聚合并行进行
+        graph_stats_task = asyncio.create_task(_get_cached_graph_stats())
+        try:
+            documents = load_documents_db()
         
-        total_size_bytes_val = sum(doc.file_size for doc in documents.values() if isinstance(doc.file_size, int))
+            total_documents = len(documents)
+            processed_documents = processing_documents = failed_documents = 0
+            total_nodes = 0
+            total_size_bytes_val = 0
+
+            # 单次遍历完成所有统计
+            for doc in documents.values():
+                status = doc.status
+                if status == "completed":
+                    processed_documents += 1
+                elif status in PROCESSING_STATES:
+                    processing_documents += 1
+                elif status in FAILED_STATES:
+                    failed_documents += 1
+
+                total_nodes += doc.node_count
+                total_size_bytes_val += doc.file_size
+
+            # Counter 的计数循环在 C 层完成
+            file_types_counts = Counter(map(attrgetter("file_type"), documents.values()))
+        except BaseException:
+            # 本地统计失败时取消并回收图谱查询任务，避免任务泄漏
+            graph_stats_task.cancel()
+            await asyncio.gather(graph_stats_task, return_exceptions=True)
+            raise
         
-        # Placeholder for relations, actual count should come from graph_stats if available
-        # This is a very rough estimate and might be misleading.
-        # Consider linking this to graphiti_service.get_graph_stats() if a global stat is needed.
-        estimated_total_relations = total_nodes * 2
+        try:
+            graph_stats = await graph_stats_task
+        except Exception as e:
+            logger.warning(f"获取图谱统计失败: {e}")
+            graph_stats = {"edge_count": 0, "status": "错误"}
 
         return {
             "total_documents": total_documents,
@@ -878,7 +1178,8 @@ async def get_document_stats():
             "processing_documents": processing_documents,
             "failed_documents": failed_documents,
             "total_extracted_nodes": total_nodes, # Renamed for clarity
-            "estimated_total_relations": estimated_total_relations,
+            "total_relations": graph_stats.get("edge_count", 0),
+            "graph_status": graph_stats.get("status"),
             "file_types": file_types_counts,
             "total_size_bytes": total_size_bytes_val,
             "total_size_mb": round(total_size_bytes_val / (1024 * 1024), 2) if total_size_bytes_val else 0.0
@@ -891,7 +1192,7 @@ async def get_document_stats():
         # Keeping original return type for now:
         return {
             "total_documents": 0, "processed_documents": 0, "processing_documents": 0,
-            "failed_documents": 0, "total_extracted_nodes": 0, "estimated_total_relations": 0,
+            "failed_documents": 0, "total_extracted_nodes": 0, "total_relations": 0,
             "file_types": {}, "total_size_bytes": 0, "total_size_mb": 0.0,
             "error": "Failed to retrieve statistics." # Added error field
         }
\ No newline at end of file
@@ -2,12 +2,15 @@
 语料导出 API 路由
 提供知识图谱数据的多格式导出功能，用于LLM训练
 """
+import os
+import re
+import asyncio
 import logging
+from stat import S_ISREG
 from typing import Optional, List
 from pathlib import Path
-import csv # For record counting in CSV
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
 from fastapi.responses import FileResponse, JSONResponse # Added JSONResponse
 from pydantic import BaseModel
 
@@ -15,13 +18,27 @@ from ..services.graphiti_service import get_graphiti_service
 # Import the actual service function with a distinct name to avoid confusion
 from ..services.graphiti_service import export_knowledge_corpus as service_export_corpus_func
 from ..core.config import get_settings
+from ..utils.http_cache import etag_json_response
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+EXPORTS_DIR = "exports"
+# 解析后的导出目录在启动时确定，避免每个请求都 resolve
+EXPORTS_BASE_DIR = Path(EXPORTS_DIR).resolve()
+DOWNLOAD_URL_PREFIX = f"{settings.API_V1_STR}/export/download/"
+
+# 一次扫描同时检查 ".."、"/" 和 "\\"
+_UNSAFE_FILE_NAME = re.compile(r"\.\.|[/\\]")
+
 router = APIRouter()
 
 
+class ExportFileResponse(FileResponse):
+    """导出文件下载响应，使用更大的读取块以减少大文件传输时的循环次数"""
+    chunk_size = 1024 * 1024
+
+
 class ExportRequest(BaseModel):
     """导出请求"""
     group_id: Optional[str] = None
@@ -53,6 +70,13 @@ class DeleteExportResponse(BaseModel):
     file_name: str
 
 
+def _validate_file_name(file_name: str, action: str) -> None:
+    """校验文件名，拒绝空名称和路径穿越字符"""
+    if not file_name or _UNSAFE_FILE_NAME.search(file_name):
+        logger.warning(f"Attempt to {action} file with invalid or traversal characters in name: {file_name}")
+        raise HTTPException(status_code=400, detail="文件名无效或包含禁止字符。")
+
+
 @router.post("/corpus", response_model=ExportResponse)
 async def export_knowledge_corpus_post(request: ExportRequest): # Renamed to avoid conflict with import
     """
@@ -70,7 +94,7 @@ async def export_knowledge_corpus_post(request: ExportRequest): # Renamed to avo
             logger.warning(f"Invalid export format requested: {request.format_type}")
             raise HTTPException(status_code=400, detail=f"不支持的导出格式: '{request.format_type}'. 支持的格式: {', '.join(allowed_formats)}")
         
-        absolute_file_path_str = await service_export_corpus_func(
+        absolute_file_path_str, record_count = await service_export_corpus_func(
             group_id=request.group_id,
             format_type=request.format_type
         )
@@ -81,19 +105,6 @@ async def export_knowledge_corpus_post(request: ExportRequest): # Renamed to avo
             raise HTTPException(status_code=500, detail="导出服务成功执行，但未能找到生成的导出文件。")
 
         file_size = exported_file.stat().st_size
-        record_count = 0
-        try:
-            if request.format_type == "jsonl" or request.format_type == "txt":
-                with open(exported_file, "r", encoding="utf-8") as f:
-                    record_count = sum(1 for _ in f)
-            elif request.format_type == "csv":
-                with open(exported_file, "r", encoding="utf-8", newline='') as f:
-                    reader = csv.reader(f)
-                    header = next(reader, None)
-                    if header: # Count rows after header
-                        record_count = sum(1 for row in reader if any(field.strip() for field in row))
-        except Exception as count_exc:
-            logger.warning(f"Could not count records in exported file {exported_file.name}: {count_exc}", exc_info=True)
 
         logger.info(f"Corpus exported successfully: {exported_file.name}, Format: {request.format_type}, Records: {record_count}")
         user_friendly_path = f"exports/{exported_file.name}"
@@ -131,27 +142,32 @@ async def export_knowledge_corpus_get(
 async def download_exported_file(file_name: str):
     """下载导出的文件。文件应位于 'exports' 目录下。"""
     try:
-        if not file_name or ".." in file_name or "/" in file_name or "\\" in file_name:
-            logger.warning(f"Attempt to download file with invalid or traversal characters in name: {file_name}")
-            raise HTTPException(status_code=400, detail="文件名无效或包含禁止字符。")
+        _validate_file_name(file_name, "download")
 
-        exports_base_dir = Path("exports").resolve()
-        file_path = (exports_base_dir / file_name).resolve()
+        file_path = (EXPORTS_BASE_DIR / file_name).resolve()
 
         # Security check: Ensure resolved path is still within the intended 'exports' directory
-        if not str(file_path).startswith(str(exports_base_dir)):
+        if not str(file_path).startswith(str(EXPORTS_BASE_DIR)):
             logger.error(f"Path traversal attempt detected for download: {file_name} resolved to {file_path}")
             raise HTTPException(status_code=403, detail="禁止访问。")
 
-        if not file_path.exists() or not file_path.is_file():
+        # stat 结果同时用于存在性检查和响应头，Starlette 不再重复 stat
+        try:
+            stat_result = await asyncio.to_thread(os.stat, file_path)
+        except OSError:
+            stat_result = None
+        if stat_result is None or not S_ISREG(stat_result.st_mode):
             logger.warning(f"File not found for download: {file_name} (resolved to {file_path})")
             raise HTTPException(status_code=404, detail="文件不存在或无法访问。")
         
         logger.info(f"Initiating download for exported file: {file_name}")
-        return FileResponse(
+        # 导出文件名带时间戳、内容不会变化，允许客户端缓存（ETag 由 Starlette 根据 mtime 和大小生成）
+        return ExportFileResponse(
             path=str(file_path),
             filename=file_name,
-            media_type='application/octet-stream' # Generic binary for download
+            media_type='application/octet-stream', # Generic binary for download
+            stat_result=stat_result,
+            headers={"Cache-Control": "private, max-age=3600"}
         )
     except HTTPException as http_exc:
         # Re-raise if it's already an HTTPException (e.g., from checks above)
@@ -161,35 +177,46 @@ async def download_exported_file(file_name: str):
         raise HTTPException(status_code=500, detail="服务器内部错误，文件下载失败。")
 
 
-@router.get("/list", response_model=ListExportedFilesResponse)
-async def list_exported_files():
-    """列出已导出的文件。"""
+def _scan_exports_dir() -> Optional[List[ExportedFileInfo]]:
+    """扫描导出目录（阻塞调用，在线程池中执行），目录不存在时返回 None"""
+    listed_files: List[ExportedFileInfo] = []
     try:
-        exports_dir = Path("exports")
-        if not exports_dir.exists() or not exports_dir.is_dir():
-            logger.info("Exports directory 'exports/' does not exist. Returning empty list.")
-            return ListExportedFilesResponse(files=[])
-
-        listed_files: List[ExportedFileInfo] = []
-        for item_path in exports_dir.iterdir():
-            if item_path.is_file():
+        # scandir 的 DirEntry 自带类型信息，无需每个文件额外 stat 判断
+        with os.scandir(EXPORTS_DIR) as entries:
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
                 # Basic check for potentially problematic filenames
-                if ".." in item_path.name or "/" in item_path.name or "\\" in item_path.name:
-                    logger.warning(f"Skipping file with potentially unsafe name in exports list: {item_path.name}")
+                if _UNSAFE_FILE_NAME.search(entry.name):
+                    logger.warning(f"Skipping file with potentially unsafe name in exports list: {entry.name}")
                     continue
                 try:
-                    stat = item_path.stat()
+                    stat = entry.stat(follow_symlinks=False)
                     listed_files.append(ExportedFileInfo(
-                        filename=item_path.name,
+                        filename=entry.name,
                         size=stat.st_size,
                         created_at=stat.st_ctime, # Creation time timestamp
-                        download_url=f"{settings.API_V1_STR}/export/download/{item_path.name}"
+                        download_url=DOWNLOAD_URL_PREFIX + entry.name
                     ))
                 except Exception as stat_exc: # Catch issues like permission errors during stat
-                    logger.error(f"Could not stat file {item_path.name} in exports directory: {stat_exc}", exc_info=True)
+                    logger.error(f"Could not stat file {entry.name} in exports directory: {stat_exc}", exc_info=True)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return listed_files
+
+
+@router.get("/list", response_model=ListExportedFilesResponse)
+@router.head("/list", response_model=ListExportedFilesResponse, include_in_schema=False)  # 轮询时用于检查 ETag，不单独出现在 OpenAPI 文档中
+async def list_exported_files(request: Request):
+    """列出已导出的文件。"""
+    try:
+        listed_files = await asyncio.to_thread(_scan_exports_dir)
+        if listed_files is None:
+            logger.info("Exports directory 'exports/' does not exist. Returning empty list.")
+            return ListExportedFilesResponse(files=[])
 
         logger.info(f"Listed {len(listed_files)} files from exports directory.")
-        return ListExportedFilesResponse(files=listed_files)
+        return etag_json_response(request, ListExportedFilesResponse(files=listed_files).model_dump())
     except Exception as e:
         logger.error("Unexpected error listing exported files", exc_info=True)
         raise HTTPException(status_code=500, detail="服务器内部错误，获取导出文件列表失败。")
@@ -199,23 +226,20 @@ async def list_exported_files():
 async def delete_exported_file(file_name: str):
     """删除指定的导出文件。"""
     try:
-        if not file_name or ".." in file_name or "/" in file_name or "\\" in file_name:
-            logger.warning(f"Attempt to delete file with invalid or traversal characters in name: {file_name}")
-            raise HTTPException(status_code=400, detail="文件名无效或包含禁止字符。")
+        _validate_file_name(file_name, "delete")
 
-        exports_base_dir = Path("exports").resolve()
-        file_path = (exports_base_dir / file_name).resolve()
+        file_path = (EXPORTS_BASE_DIR / file_name).resolve()
         
         # Security check: Ensure resolved path is still within 'exports'
-        if not str(file_path).startswith(str(exports_base_dir)):
+        if not str(file_path).startswith(str(EXPORTS_BASE_DIR)):
             logger.error(f"Path traversal attempt detected for delete: {file_name} resolved to {file_path}")
             raise HTTPException(status_code=403, detail="禁止访问。")
         
-        if not file_path.exists() or not file_path.is_file():
+        if not await asyncio.to_thread(file_path.is_file):
             logger.warning(f"File not found for deletion: {file_name} (resolved to {file_path})")
             raise HTTPException(status_code=404, detail="要删除的文件不存在。")
         
-        file_path.unlink() # Delete the file
+        await asyncio.to_thread(file_path.unlink) # Delete the file
         logger.info(f"Successfully deleted exported file: {file_name}")
         
         return DeleteExportResponse(message="文件删除成功", file_name=file_name)
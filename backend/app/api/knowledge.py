@@ -23,6 +23,7 @@ class SearchRequest(BaseModel):
     query: str
     group_id: Optional[str] = None
     limit: int = 50
+    no_cache: bool = False  # 为 True 时跳过搜索结果缓存
 
 
 @router.post("/search", response_model=SearchResult)
@@ -42,7 +43,8 @@ async def search_knowledge_graph(request: SearchRequest):
 
         service_result = await service.search_knowledge(
             query=request.query,
-            limit=request.limit
+            limit=request.limit,
+            use_cache=not request.no_cache
         )
         
         if not service_result.get("success"):
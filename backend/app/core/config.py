@@ -1,13 +1,33 @@
 """
 桥梁工程知识图谱平台 - 配置管理
 """
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, DotEnvSettingsSource, EnvSettingsSource
 from pydantic import Field
-from typing import Optional
-from functools import lru_cache
+from typing import Any, Optional
 import os
 
 
+# 可用逗号分隔书写的列表型配置，如 BACKEND_CORS_ORIGINS=http://a,http://b（仍兼容 JSON 数组）
+_COMMA_SEPARATED_FIELDS = frozenset({"BACKEND_CORS_ORIGINS", "ALLOWED_HOSTS"})
+
+
+class _CommaSeparatedMixin:
+    """对逗号分隔的列表配置直接拆分，跳过 JSON 解析"""
+
+    def prepare_field_value(self, field_name: str, field: Any, value: Any, value_is_complex: bool) -> Any:
+        if field_name in _COMMA_SEPARATED_FIELDS and isinstance(value, str) and not value.lstrip().startswith("["):
+            return tuple(item.strip() for item in value.split(",") if item.strip())
+        return super().prepare_field_value(field_name, field, value, value_is_complex)
+
+
+class _CommaSeparatedEnvSource(_CommaSeparatedMixin, EnvSettingsSource):
+    pass
+
+
+class _CommaSeparatedDotEnvSource(_CommaSeparatedMixin, DotEnvSettingsSource):
+    pass
+
+
 class Settings(BaseSettings):
     """应用配置类"""
     
@@ -62,7 +82,7 @@ class Settings(BaseSettings):
     # 文件存储配置
     UPLOAD_DIR: str = Field(default="./uploads", env="UPLOAD_DIR")
     MAX_FILE_SIZE: int = Field(default=100_000_000, env="MAX_FILE_SIZE")  # 100MB
-    ALLOWED_EXTENSIONS: list = [".pdf", ".docx", ".doc", ".dxf", ".dwg", ".ifc"]
+    ALLOWED_EXTENSIONS: tuple[str, ...] = (".pdf", ".docx", ".doc", ".dxf", ".dwg", ".ifc")
     
     # MinIO 配置 (可选)
     MINIO_ENDPOINT: Optional[str] = Field(default=None, env="MINIO_ENDPOINT")
@@ -78,28 +98,47 @@ class Settings(BaseSettings):
     TASK_TIMEOUT: int = Field(default=3600, env="TASK_TIMEOUT")  # 1小时
     
     # CORS 配置
-    BACKEND_CORS_ORIGINS: list = Field(
-        default=["http://localhost:3000", "http://localhost:5173"],
+    BACKEND_CORS_ORIGINS: tuple[str, ...] = Field(
+        default=("http://localhost:3000", "http://localhost:5173"),
         env="BACKEND_CORS_ORIGINS"
     )
     
+    # 允许的 Host 头（生产环境生效）；包含 "*" 时不做检查
+    ALLOWED_HOSTS: tuple[str, ...] = Field(default=("*",), env="ALLOWED_HOSTS")
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
 
+    @classmethod
+    def settings_customise_sources(cls, settings_cls, init_settings, env_settings, dotenv_settings, file_secret_settings):
+        """环境变量和 .env 中的列表配置支持逗号分隔写法"""
+        return (
+            init_settings,
+            _CommaSeparatedEnvSource(settings_cls),
+            _CommaSeparatedDotEnvSource(settings_cls),
+            file_secret_settings,
+        )
+
+
+# 配置单例，导入时创建
+settings = Settings()
+
 
-@lru_cache()
 def get_settings() -> Settings:
-    """获取配置实例 (单例模式)"""
-    return Settings()
+    """获取配置实例（兼容旧调用，新代码直接导入 settings）"""
+    return settings
 
 
 # 创建上传目录
 def create_upload_dir():
     """创建上传目录"""
-    settings = get_settings()
-    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-    
-    # 创建子目录
-    for subdir in ["pdf", "doc", "cad", "bim", "temp"]:
-        os.makedirs(os.path.join(settings.UPLOAD_DIR, subdir), exist_ok=True) 
\ No newline at end of file
+    base = settings.UPLOAD_DIR
+    os.makedirs(base, exist_ok=True)
+    
+    # 创建子目录：父目录已存在，单次 mkdir 即可，无需 makedirs 逐级检查
+    for subdir in ("pdf", "doc", "cad", "bim", "temp"):
+        try:
+            os.mkdir(os.path.join(base, subdir))
+        except FileExistsError:
+            pass 
\ No newline at end of file
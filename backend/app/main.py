@@ -2,20 +2,25 @@
 桥梁工程知识图谱平台 - FastAPI 主应用
 """
 from fastapi import FastAPI, Request
+from fastapi.exception_handlers import http_exception_handler, request_validation_exception_handler
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
+from starlette.exceptions import HTTPException as StarletteHTTPException
 import time
+import asyncio
+import orjson
+import queue
 import logging
-import socket
+import logging.handlers
 import sys # For exiting if no port is available
-from contextlib import asynccontextmanager
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager, suppress
 from typing import Optional
 
-from .core.config import get_settings, create_upload_dir
+from .core.config import settings, create_upload_dir
 from .api import documents, knowledge, export
-import psutil
-import platform
+from .utils.json_response import OrjsonResponse
 
 # 配置日志
 logging.basicConfig(
@@ -24,8 +29,67 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 获取配置
-settings = get_settings()
+# /info 中运行期间不会变化的部分，启动时构建一次
+_STATIC_APP_INFO = {
+    "name": settings.PROJECT_NAME,
+    "version": settings.VERSION,
+    "debug": settings.DEBUG,
+    "neo4j_uri": settings.NEO4J_URI,
+    "ollama_url": settings.OLLAMA_BASE_URL,
+    "ollama_llm_model": settings.OLLAMA_LLM_MODEL,
+    "ollama_embed_model": settings.OLLAMA_EMBED_MODEL,
+    "max_file_size": settings.MAX_FILE_SIZE,
+    "allowed_extensions": settings.ALLOWED_EXTENSIONS,
+}
+
+# 后台采样的系统信息，/info 直接读取，避免请求中阻塞等待采样
+SYSTEM_SAMPLE_INTERVAL = 2.0  # 秒
+_system_stats = {
+    "cpu_usage": 0.0,
+    "memory_usage": 0.0,
+    "disk_usage": 0.0,
+    "platform": "Unknown",
+    "architecture": "Unknown"
+}
+# 采样任务在首次访问 /info 时才启动，未访问过的 worker 不加载 psutil
+_system_sampler_task: Optional[asyncio.Task] = None
+
+
+def _sample_system_stats():
+    """采样一次系统信息（CPU 为距上次采样的平均值，首次为 0，调用不阻塞）"""
+    try:
+        import psutil
+
+        _system_stats["cpu_usage"] = round(psutil.cpu_percent(interval=None), 1)
+        _system_stats["memory_usage"] = round(psutil.virtual_memory().percent, 1)
+        _system_stats["disk_usage"] = round(psutil.disk_usage('/').percent, 1)
+    except Exception as e:
+        logger.error(f"获取系统信息失败: {e}")
+
+
+async def _system_sampler():
+    """定期刷新系统信息"""
+    while True:
+        await asyncio.sleep(SYSTEM_SAMPLE_INTERVAL)
+        _sample_system_stats()
+
+
+@contextmanager
+def _queued_logging():
+    """运行期间经队列写日志：请求路径上仍会合并消息参数和异常堆栈，时间戳格式化和写出由后台线程完成"""
+    root_logger = logging.getLogger()
+    handlers = root_logger.handlers[:]
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))  # 入队前只渲染消息本身，完整格式由原处理器套用
+    root_logger.handlers[:] = [queue_handler]
+    listener.start()
+    try:
+        yield
+    finally:
+        root_logger.handlers[:] = handlers
+        listener.stop()  # 写完队列中剩余的日志
 
 
 # Lifespan context manager
@@ -35,25 +99,48 @@ async def lifespan(app: FastAPI):
     logger.info(f"启动 {settings.PROJECT_NAME} v{settings.VERSION}")
     # 创建必要的目录
     create_upload_dir()
-
-    # 初始化 Graphiti 服务并创建 Neo4j 索引/约束
-    try:
-        from .services.graphiti_service import get_graphiti_service, create_neo4j_indexes_and_constraints
-        graphiti_service = get_graphiti_service() # Ensure it's initialized
-        if graphiti_service.is_available():
-            logger.info("Graphiti service initialized. Attempting to create Neo4j indexes and constraints...")
-            await create_neo4j_indexes_and_constraints(graphiti_service)
-        else:
-            logger.error("Graphiti service is not available. Skipping Neo4j index creation.")
-    except Exception as e:
-        logger.error(f"Error during startup (Graphiti service init or index creation): {e}", exc_info=True)
-        # Depending on severity, you might want to prevent app startup
-        # For now, just log the error.
-
-    logger.info("应用启动完成 - Lifespan Startup")
-    yield
-    # Shutdown
-    logger.info("应用正在关闭...") # Adjusted to match user's requested log message
+    # 预先生成并序列化 OpenAPI 文档，避免首个请求承担生成开销
+    _build_openapi_body()
+
+    async with AsyncExitStack() as stack:
+        # 运行期间日志由后台线程写出，关闭时恢复原处理器
+        stack.enter_context(_queued_logging())
+        # 进入各路由模块自带的生命周期（如文档元数据写回任务），退出时按相反顺序关闭
+        for router_module in (documents, knowledge, export):
+            router_lifespan = getattr(router_module, "lifespan", None)
+            if router_lifespan is not None:
+                await stack.enter_async_context(router_lifespan(app))
+
+        # 关闭时释放 DeepSeek 客户端共享的 HTTP 连接池；导入失败不影响后续的 Graphiti 初始化
+        try:
+            from .services.deepseek_client import close_http_client
+            stack.push_async_callback(close_http_client)
+        except Exception as e:
+            logger.warning(f"DeepSeek 客户端模块不可用，跳过连接池清理注册: {e}")
+
+        # 初始化 Graphiti 服务并创建 Neo4j 索引/约束
+        try:
+            from .services.graphiti_service import get_graphiti_service, create_neo4j_indexes_and_constraints
+            # 客户端初始化是同步阻塞的，放到线程池中执行
+            graphiti_service = await asyncio.to_thread(get_graphiti_service) # Ensure it's initialized
+            if graphiti_service.is_available():
+                logger.info("Graphiti service initialized. Attempting to create Neo4j indexes and constraints...")
+                await create_neo4j_indexes_and_constraints(graphiti_service)
+            else:
+                logger.error("Graphiti service is not available. Skipping Neo4j index creation.")
+        except Exception as e:
+            logger.error(f"Error during startup (Graphiti service init or index creation): {e}", exc_info=True)
+            # Depending on severity, you might want to prevent app startup
+            # For now, just log the error.
+
+        logger.info("应用启动完成 - Lifespan Startup")
+        yield
+        # Shutdown
+        logger.info("应用正在关闭...") # Adjusted to match user's requested log message
+        if _system_sampler_task is not None:
+            _system_sampler_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await _system_sampler_task
 
 
 # 创建 FastAPI 应用
@@ -62,6 +149,7 @@ app = FastAPI(
     version=settings.VERSION,
     description="基于 Graphiti 的桥梁工程知识图谱构建平台",
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    default_response_class=OrjsonResponse,
     lifespan=lifespan
 )
 
@@ -74,28 +162,54 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 添加信任主机中间件
-if not settings.DEBUG:
-    app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
+# 添加信任主机中间件（通配时接受所有 Host，无需在每个请求上检查）
+if not settings.DEBUG and "*" not in settings.ALLOWED_HOSTS:
+    app.add_middleware(TrustedHostMiddleware, allowed_hosts=list(settings.ALLOWED_HOSTS))
+
+
+# 单调时钟，计时不受系统时间调整影响
+_perf_counter = time.perf_counter
+
+
+class ProcessTimeMiddleware:
+    """添加请求处理时间到响应头（纯 ASGI 实现，不经过 BaseHTTPMiddleware 的任务组和响应包装）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = _perf_counter()
+
+        async def send_with_process_time(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-process-time", f"{_perf_counter() - start_time:.6f}".encode()))
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_process_time)
 
 
 # 请求处理时间中间件
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    """添加请求处理时间到响应头"""
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
-    return response
+app.add_middleware(ProcessTimeMiddleware)
 
 
 # 全局异常处理器
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    """全局异常处理"""
+    """全局异常处理（仅处理未预期的异常，记录完整堆栈）"""
+    # 预期内的 HTTP/校验错误交回 FastAPI 的默认处理，不记录堆栈
+    if isinstance(exc, StarletteHTTPException):
+        return await http_exception_handler(request, exc)
+    if isinstance(exc, RequestValidationError):
+        return await request_validation_exception_handler(request, exc)
+
     logger.error(f"全局异常: {str(exc)}", exc_info=True)
-    return JSONResponse(
+    return OrjsonResponse(
         status_code=500,
         content={
             "message": "服务器内部错误",
@@ -104,16 +218,19 @@ async def global_exception_handler(request: Request, exc: Exception):
     )
 
 
+# 健康检查响应中的固定字段
+_HEALTH_STATIC = {
+    "status": "healthy",
+    "service": settings.PROJECT_NAME,
+    "version": settings.VERSION,
+}
+
+
 # 健康检查
 @app.get("/health")
 async def health_check():
     """健康检查端点"""
-    return {
-        "status": "healthy",
-        "service": settings.PROJECT_NAME,
-        "version": settings.VERSION,
-        "timestamp": time.time()
-    }
+    return {**_HEALTH_STATIC, "timestamp": time.time()}
 
 
 # 根路径
@@ -152,87 +269,60 @@ app.include_router(
 @app.get(f"{settings.API_V1_STR}/info")
 async def get_app_info():
     """获取应用信息"""
-    try:
-        # 获取系统信息
-        cpu_percent = psutil.cpu_percent(interval=1)
-        memory = psutil.virtual_memory()
-        disk = psutil.disk_usage('/')
-        
-        return {
-            "name": settings.PROJECT_NAME,
-            "version": settings.VERSION,
-            "debug": settings.DEBUG,
-            "neo4j_uri": settings.NEO4J_URI,
-            "ollama_url": settings.OLLAMA_BASE_URL,
-            "ollama_llm_model": settings.OLLAMA_LLM_MODEL,
-            "ollama_embed_model": settings.OLLAMA_EMBED_MODEL,
-            "max_file_size": settings.MAX_FILE_SIZE,
-            "allowed_extensions": settings.ALLOWED_EXTENSIONS,
-            "system": {
-                "cpu_usage": round(cpu_percent, 1),
-                "memory_usage": round(memory.percent, 1),
-                "disk_usage": round(disk.percent, 1),
-                "platform": platform.system(),
-                "architecture": platform.machine()
-            }
-        }
-    except Exception as e:
-        logger.error(f"获取系统信息失败: {e}")
-        return {
-            "name": settings.PROJECT_NAME,
-            "version": settings.VERSION,
-            "debug": settings.DEBUG,
-            "system": {
-                "cpu_usage": 0,
-                "memory_usage": 0,
-                "disk_usage": 0,
-                "platform": "Unknown",
-                "architecture": "Unknown"
-            }
-        }
+    global _system_sampler_task
+    if _system_sampler_task is None:
+        import platform
+
+        _system_stats["platform"] = platform.system()
+        _system_stats["architecture"] = platform.machine()
+        _sample_system_stats()
+        _system_sampler_task = asyncio.create_task(_system_sampler())
+    return {**_STATIC_APP_INFO, "system": dict(_system_stats)}
+
+
+# 序列化后的 OpenAPI 文档（路由在运行期间不变，生成一次即可）
+_openapi_body: Optional[bytes] = None
+
+
+def _build_openapi_body() -> bytes:
+    """生成 OpenAPI 文档并缓存其 JSON 字节"""
+    global _openapi_body
+    if _openapi_body is None:
+        _openapi_body = orjson.dumps(app.openapi())
+    return _openapi_body
+
+
+async def openapi_json(request: Request) -> Response:
+    """返回预先序列化的 OpenAPI 文档"""
+    return Response(_build_openapi_body(), media_type="application/json")
+
+
+# 替换 FastAPI 默认的 openapi 路由（默认实现每次请求都重新序列化整个文档）
+app.router.routes[:] = [route for route in app.router.routes if getattr(route, "path", None) != app.openapi_url]
+app.add_route(app.openapi_url, openapi_json, include_in_schema=False)
 
 
 if __name__ == "__main__":
+    import socket
     import uvicorn
 
     def find_available_port(host: str, start_port: int, max_attempts: int = 10) -> Optional[int]:
-        """Tries to find an available port by binding to it."""
-        for port_candidate in range(start_port, start_port + max_attempts):
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        """Tries to find an available port by binding one probe socket to successive ports."""
+        # 绑定失败的套接字仍处于未绑定状态，可以继续尝试下一个端口，无需每次新建
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            for port_candidate in range(start_port, start_port + max_attempts):
+                try:
                     s.bind((host, port_candidate))
+                except OSError as e:
+                    logger.warning(f"端口 {port_candidate} 在主机 {host} 上已被占用或发生错误: {e}")
+                    continue
                 logger.info(f"端口 {port_candidate} 在主机 {host} 上可用.")
                 return port_candidate
-            except OSError as e:
-                logger.warning(f"端口 {port_candidate} 在主机 {host} 上已被占用或发生错误: {e}")
-                continue
         return None
 
     host_to_use = settings.HOST
-    # Try default port first, then iterate through a range based on settings.PORT as start
-    # The user's example uses a fixed start_port=8000 and max_attempts=10.
-    # We can make this configurable via settings if needed, or combine with RETRY_PORTS.
-    # For now, let's try the main port, then a sequence.
-
-    port_to_use = None
-    # Check initial port from settings
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.bind((host_to_use, settings.PORT))
-        port_to_use = settings.PORT
-        logger.info(f"默认端口 {settings.PORT} 在主机 {host_to_use} 上可用.")
-    except OSError:
-        logger.warning(f"默认端口 {settings.PORT} 在主机 {host_to_use} 上已被占用. 尝试备用端口...")
-        # Define a range for trying alternative ports if default is taken
-        # This replaces the direct use of settings.RETRY_PORTS with a range logic
-        # Max attempts for finding an alternative if default is taken.
-        # Start searching from settings.PORT + 1
-        alternative_start_port = settings.PORT + 1
-        # Let's use a reasonable number of attempts, e.g., 10, as in user's example.
-        # Or, could use len(settings.RETRY_PORTS) if we want to keep that configurable.
-        # For simplicity, let's use a fixed number of attempts for alternatives.
-        max_alt_attempts = 10
-        port_to_use = find_available_port(host_to_use, alternative_start_port, max_alt_attempts)
+    # 先尝试默认端口，被占用时依次尝试其后的 10 个端口
+    port_to_use = find_available_port(host_to_use, settings.PORT, max_attempts=11)
 
     if port_to_use is None:
         logger.error(
@@ -247,5 +337,8 @@ if __name__ == "__main__":
         host=host_to_use,
         port=port_to_use,
         reload=settings.DEBUG,
-        log_level="info"
-    )
\ No newline at end of file
+        log_level="info",
+        # uvicorn[standard] 已包含 uvloop 与 httptools；uvloop 不支持 Windows
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools"
+    )
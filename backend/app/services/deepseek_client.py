@@ -3,36 +3,193 @@
 自定义 DeepSeek 客户端，兼容 Graphiti
 """
 
+import hashlib
 import json
 import logging
-import tiktoken
-from typing import Any, Dict, List, Optional, Type
-from pydantic import BaseModel
+from collections import OrderedDict, deque
+from functools import lru_cache
+import httpx
+import orjson
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple, Type
+from pydantic import BaseModel, ValidationError
 from openai import AsyncOpenAI
 from graphiti_core.llm_client.openai_client import OpenAIClient
 from graphiti_core.llm_client.config import LLMConfig
 
+if TYPE_CHECKING:
+    import tiktoken
+
 logger = logging.getLogger(__name__)
 
+# 从响应文本中提取 JSON 对象用的解码器（raw_decode 可从任意位置解析并返回结束位置）
+_JSON_DECODER = json.JSONDecoder()
+
+# 所有 DeepSeek 客户端共享的 HTTP 连接池（HTTP/2 多路复用，Graphiti 并发抽取时无需为每个请求新建连接）
+# 首次使用时在当前事件循环中创建，应用关闭时由 close_http_client 释放
+_HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+
+def _get_http_client() -> httpx.AsyncClient:
+    """获取共享的 HTTP 连接池，不存在或已关闭时创建"""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed:
+        # 读超时与 openai SDK 默认值一致，长输出的结构化请求可能持续数分钟
+        _HTTP_CLIENT = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+            timeout=httpx.Timeout(600.0, connect=5.0),
+        )
+    return _HTTP_CLIENT
+
+
+async def close_http_client():
+    """关闭共享的 HTTP 连接池，并清空引用它的 AsyncOpenAI 客户端缓存"""
+    global _HTTP_CLIENT
+    client, _HTTP_CLIENT = _HTTP_CLIENT, None
+    DeepSeekClient._CLIENT_CACHE.clear()
+    if client is not None:
+        await client.aclose()
+
+
+# 结构化响应缓存的最大条目数
+RESPONSE_CACHE_SIZE = 1024
+# 温度不高于该值的结构化请求视为确定性输出，结果可缓存
+RESPONSE_CACHE_MAX_TEMPERATURE = 0.1
+
+# 单条消息超长时，替换被截去的中间部分的标记
+TRUNCATION_MARKER = "\n...[内容被截断]...\n"
+
+# 批量计算 token 时 tiktoken 使用的线程数
+TOKENIZER_THREADS = 4
+# 按字符估算的 token 数低于输入上限的该比例时，跳过 tokenizer 精确计算
+TOKEN_ESTIMATE_RATIO = 0.8
+
+
+def _estimate_text_tokens(text: str) -> int:
+    """按字符数从宽估算 token 数量：ASCII 按 2 字符/token，中文等非 ASCII 字符按 2 token/字符计
+
+    常见文本的实际 token 数约为估算值的一半以下；大量标点或罕见字符的极端文本仍可能被低估，
+    因此只在估算值明显低于上限（TOKEN_ESTIMATE_RATIO）时才跳过精确计算。
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (ascii_chars + 1) // 2 + 2 * (len(text) - ascii_chars)
+
+
+def _estimate_messages_tokens(messages: List[Dict[str, Any]]) -> int:
+    """估算消息列表的 token 数量（不调用 tokenizer，结构开销与精确计算一致）"""
+    return sum(
+        _estimate_text_tokens(message.get("content") or "") + _estimate_text_tokens(message.get("role") or "") + 4
+        for message in messages
+    ) + 2
+
+
+def _extract_first_json(text: str) -> Optional[Dict[str, Any]]:
+    """依次从每个 "{" 处尝试解析，返回第一个完整的 JSON 对象，找不到时返回 None"""
+    index = text.find("{")
+    while index != -1:
+        try:
+            obj, _ = _JSON_DECODER.raw_decode(text, index)
+            return obj
+        except json.JSONDecodeError:
+            index = text.find("{", index + 1)
+    return None
+
+
+@lru_cache(maxsize=4)
+def _get_encoding(model: str) -> "tiktoken.Encoding":
+    """获取模型对应的 tokenizer（各客户端实例共享，避免重复构建编码表）
+
+    tiktoken 导入和编码表加载较重，只在字符估算接近上限、需要精确计算时才执行
+    """
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # DeepSeek 等非 OpenAI 模型不在 tiktoken 注册表中，使用通用编码
+        return tiktoken.get_encoding("cl100k_base")
+
+
+# JSON Schema 中以名称为键的映射（键是字段名而非 schema 关键字）
+_SCHEMA_NAME_MAPS = frozenset({"properties", "patternProperties", "$defs", "definitions"})
+# 取值为数据而非子 schema 的关键字，原样保留
+_SCHEMA_DATA_KEYS = frozenset({"default", "enum", "const", "examples"})
+
+
+def _compact_schema(node: Any) -> Any:
+    """去掉 JSON Schema 中 Pydantic 自动生成的 title，减少发送给模型的 token（保留 description）"""
+    if isinstance(node, list):
+        return [_compact_schema(item) for item in node]
+    if not isinstance(node, dict):
+        return node
+    compact = {}
+    for key, value in node.items():
+        if key == "title":
+            continue
+        if key in _SCHEMA_DATA_KEYS:
+            compact[key] = value
+        elif key in _SCHEMA_NAME_MAPS and isinstance(value, dict):
+            compact[key] = {name: _compact_schema(sub_schema) for name, sub_schema in value.items()}
+        else:
+            compact[key] = _compact_schema(value)
+    return compact
+
+
+# 必需字段缺失时按 JSON Schema 类型填充的默认值（工厂函数，避免共享可变对象）
+_DEFAULT_FACTORY_FOR_TYPE: Dict[str, Callable[[], Any]] = {
+    "array": list,
+    "object": dict,
+    "string": str,
+    "number": int,
+    "integer": int,
+    "boolean": bool,
+}
+
+
+def _none_factory() -> None:
+    """未知类型的默认值"""
+    return None
+
+
+@lru_cache(maxsize=64)
+def _build_system_prompt(response_model: Type[BaseModel]) -> Tuple[str, Dict[str, Callable[[], Any]]]:
+    """按响应模型类构建并缓存 JSON 模式的系统提示，返回 (系统提示, 必需字段的默认值工厂)
+
+    返回的字典为共享缓存，调用方不得修改
+    """
+    json_schema = response_model.model_json_schema()
+    system_prompt = f"""
+请严格按照以下 JSON Schema 格式返回结果，不要包含任何其他文本：
+
+Schema:
+{orjson.dumps(_compact_schema(json_schema)).decode()}
+
+要求：
+1. 返回有效的 JSON 格式
+2. 严格遵循 schema 结构
+3. 不要添加任何解释或其他文本
+4. 确保所有必需字段都存在
+5. 如果没有找到相关内容，返回空数组而不是省略字段
+"""
+    schema_properties = json_schema.get("properties", {})
+    default_factories = {
+        field: _DEFAULT_FACTORY_FOR_TYPE.get(schema_properties.get(field, {}).get("type", "string"), _none_factory)
+        for field in json_schema.get("required", [])
+    }
+    return system_prompt, default_factories
+
+
 class DeepSeekClient(OpenAIClient):
     """自定义 DeepSeek 客户端，兼容 Graphiti"""
     
+    # 按 (api_key, base_url) 复用的 AsyncOpenAI 客户端，Graphiti 重新实例化时沿用已建立的连接
+    _CLIENT_CACHE: Dict[Tuple[Optional[str], Optional[str]], AsyncOpenAI] = {}
+    
     def __init__(self, config: LLMConfig):
-        # 初始化父类
-        super().__init__(config)
-        
-        # 重新创建客户端，使用 DeepSeek 配置
-        self.client = AsyncOpenAI(
-            api_key=config.api_key,
-            base_url=config.base_url
-        )
+        # 使用 DeepSeek 配置的共享客户端初始化父类，父类不再另建客户端
+        super().__init__(config, client=self._get_shared_client(config.api_key, config.base_url))
         self.config = config
-        
-        # 初始化 tokenizer 用于计算 token 数量
-        try:
-            self.tokenizer = tiktoken.encoding_for_model("gpt-3.5-turbo")
-        except:
-            self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        # 结构化响应 LRU 缓存：相同请求不再调用 API（键为请求内容摘要）
+        self._response_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
         
         # DeepSeek 的限制
         # 根据 DeepSeek 官方文档 (通常 deepseek-chat 为 32k context, 8k output completion)
@@ -42,8 +199,7 @@ class DeepSeekClient(OpenAIClient):
         self.MAX_INPUT_TOKENS = self.MAX_CONTEXT_LENGTH - self.RESERVED_TOKENS # 最大输入 token 数量
 
         logger.info(
-            f"DeepSeek Tokenizer: {self.tokenizer.name}. "
-            f"Context Length: {self.MAX_CONTEXT_LENGTH}, "
+            f"DeepSeek Context Length: {self.MAX_CONTEXT_LENGTH}, "
             f"Max Output Tokens: {self.MAX_OUTPUT_TOKENS}, "
             f"Reserved for Output: {self.RESERVED_TOKENS}, "
             f"Max Input Tokens: {self.MAX_INPUT_TOKENS}"
@@ -53,78 +209,170 @@ class DeepSeekClient(OpenAIClient):
         api_key_to_log = config.api_key[:5] + "..." + config.api_key[-4:] if config.api_key and len(config.api_key) > 9 else "Not Set or Too Short"
         logger.info(f"✅ DeepSeek 客户端初始化: model={config.model}, base_url={config.base_url}, api_key_used={api_key_to_log}")
     
+    @property
+    def tokenizer(self) -> "tiktoken.Encoding":
+        """用于精确计算 token 数量的 tokenizer（首次使用时才加载）"""
+        return _get_encoding(self.config.model or "")
+    
+    @classmethod
+    def _get_shared_client(cls, api_key: Optional[str], base_url: Optional[str]) -> AsyncOpenAI:
+        """获取指定 api_key 和 base_url 的共享 AsyncOpenAI 客户端，不存在时创建"""
+        key = (api_key, base_url)
+        client = cls._CLIENT_CACHE.get(key)
+        if client is None:
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=_get_http_client())
+            cls._CLIENT_CACHE[key] = client
+        return client
+    
     def _count_tokens(self, text: str) -> int:
         """计算文本的 token 数量"""
-        try:
-            return len(self.tokenizer.encode(text))
-        except:
-            # 如果编码失败，使用粗略估计：1 token ≈ 4 字符
-            return len(text) // 4
+        if not isinstance(text, str):
+            # 非字符串内容（如 None）无法编码，使用粗略估计：1 token ≈ 4 字符
+            return len(str(text or "")) // 4
+        return len(self.tokenizer.encode_ordinary(text))
     
-    def _count_messages_tokens(self, messages: List[Dict[str, Any]]) -> int:
-        """计算消息列表的总 token 数量"""
-        total_tokens = 0
-        for message in messages:
-            # 计算消息结构的开销
-            total_tokens += 4  # role 和 content 字段的开销
-            total_tokens += self._count_tokens(message.get("content", ""))
-            total_tokens += self._count_tokens(message.get("role", ""))
-        total_tokens += 2  # 对话结束标记
-        return total_tokens
+    def _count_messages_tokens_per_msg(self, messages: List[Dict[str, Any]]) -> Tuple[int, List[int]]:
+        """计算消息列表的总 token 数量，以及每条消息的 token 数量（含结构开销）"""
+        # 一次批量编码所有 role 和 content（无特殊 token，使用 encode_ordinary_batch 跳过特殊 token 扫描）
+        texts = [message.get("content") or "" for message in messages]
+        texts += [message.get("role") or "" for message in messages]
+        lengths = list(map(len, self.tokenizer.encode_ordinary_batch(texts, num_threads=TOKENIZER_THREADS)))
+        # 每条消息 4 个结构开销（role 和 content 字段）
+        count = len(messages)
+        per_message = [content + role + 4 for content, role in zip(lengths[:count], lengths[count:])]
+        return sum(per_message) + 2, per_message  # 另加 2 个对话结束标记
     
-    def _truncate_messages(self, messages: List[Dict[str, Any]], max_tokens: int) -> List[Dict[str, Any]]:
-        """截断消息以适应 token 限制"""
+    def _truncate_messages(
+        self,
+        messages: List[Dict[str, Any]],
+        max_tokens: int,
+        message_tokens: Optional[List[int]] = None
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """截断消息以适应 token 限制，返回截断后的消息及其 token 数量
+
+        message_tokens 为每条消息已计算好的 token 数量，未传入时在此统一计算一次
+        """
         if not messages:
-            return messages
+            return messages, 2
+        if message_tokens is None:
+            _, message_tokens = self._count_messages_tokens_per_msg(messages)
         
         # 保留系统消息（通常是第一条）
-        truncated_messages = []
         system_message = None
+        system_tokens = 0
         user_messages = []
         
-        for message in messages:
+        for message, tokens in zip(messages, message_tokens):
             if message.get("role") == "system":
                 system_message = message
+                system_tokens = tokens
             else:
-                user_messages.append(message)
-        
-        # 计算系统消息的 token 数
-        system_tokens = 0
-        if system_message:
-            system_tokens = self._count_tokens(system_message.get("content", "")) + 4
-            truncated_messages.append(system_message)
+                user_messages.append((message, tokens))
         
-        # 为用户消息分配剩余的 token
-        remaining_tokens = max_tokens - system_tokens
+        # 为用户消息分配剩余的 token（扣除 2 个对话结束标记）
+        remaining_tokens = max_tokens - system_tokens - 2
         
-        # 从最新的消息开始，逐步添加直到达到限制
+        # 从最新的消息开始，逐步累加已计算好的 token 数，直到达到限制
+        # 倒序遍历时从左侧加入，保持原有顺序（避免 list.insert 的逐次移动）
+        kept_messages = deque()
         current_tokens = 0
-        for message in reversed(user_messages):
-            message_tokens = self._count_tokens(message.get("content", "")) + 4
-            
-            if current_tokens + message_tokens <= remaining_tokens:
-                truncated_messages.insert(-1 if system_message else 0, message)
-                current_tokens += message_tokens
+        for message, tokens in reversed(user_messages):
+            if current_tokens + tokens <= remaining_tokens:
+                kept_messages.appendleft(message)
+                current_tokens += tokens
             else:
                 # 如果单条消息太长，尝试截断内容
-                if len(truncated_messages) == (1 if system_message else 0):
+                if not kept_messages:
                     # 这是第一条用户消息，必须包含一些内容
-                    available_tokens = remaining_tokens - 4  # 减去消息结构开销
+                    role_tokens = self._count_tokens(message.get("role") or "")
+                    available_tokens = remaining_tokens - role_tokens - 4  # 减去 role 和消息结构开销
                     if available_tokens > 100:  # 至少保留100个token
-                        content = message.get("content", "")
-                        # 粗略估计：1 token ≈ 4 字符
-                        max_chars = available_tokens * 4
-                        if len(content) > max_chars:
-                            # 从中间截断，保留开头和结尾
-                            keep_start = max_chars // 3
-                            keep_end = max_chars // 3
-                            truncated_content = content[:keep_start] + "\n...[内容被截断]...\n" + content[-keep_end:]
+                        # 按 token 从中间截断，保留开头和结尾（中文按字符估算误差大，直接在 token 序列上切分）
+                        token_ids = self.tokenizer.encode_ordinary(message.get("content") or "")
+                        marker_ids = self.tokenizer.encode_ordinary(TRUNCATION_MARKER)
+                        keep_tokens = (available_tokens - len(marker_ids)) // 2
+                        if keep_tokens > 0 and len(token_ids) > 2 * keep_tokens + len(marker_ids):
+                            truncated_content = self.tokenizer.decode(
+                                token_ids[:keep_tokens] + marker_ids + token_ids[-keep_tokens:]
+                            )
                             truncated_message = {**message, "content": truncated_content}
-                            truncated_messages.insert(-1 if system_message else 0, truncated_message)
+                            kept_messages.appendleft(truncated_message)
+                            # 解码后重新编码时切分点附近的 token 可能合并，按实际内容计算
+                            current_tokens += self._count_tokens(truncated_content) + role_tokens + 4
                 break
         
+        truncated_messages = ([system_message] if system_message else []) + list(kept_messages)
         logger.info(f"消息截断: 原始 {len(messages)} 条 -> 截断后 {len(truncated_messages)} 条")
-        return truncated_messages
+        return truncated_messages, system_tokens + current_tokens + 2
+    
+    def _fit_input_limit(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """检查并截断消息以适应输入 token 限制（字符估算明显低于上限时不做精确计算）"""
+        estimated_tokens = _estimate_messages_tokens(messages)
+        if estimated_tokens <= self.MAX_INPUT_TOKENS * TOKEN_ESTIMATE_RATIO:
+            logger.debug(f"请求 token 数量估算: {estimated_tokens}")
+            return messages
+        
+        total_tokens, message_tokens = self._count_messages_tokens_per_msg(messages)
+        logger.info(f"请求 token 数量: {total_tokens}")
+        
+        if total_tokens > self.MAX_INPUT_TOKENS:
+            logger.warning(f"Token 数量超限 ({total_tokens} > {self.MAX_INPUT_TOKENS})，开始截断...")
+            messages, final_tokens = self._truncate_messages(messages, self.MAX_INPUT_TOKENS, message_tokens)
+            logger.info(f"截断后 token 数量: {final_tokens}")
+        return messages
+    
+    async def _make_chat_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        max_tokens: Optional[int],
+        **params
+    ) -> Any:
+        """调用 chat completions API：先按输入 token 限制截断消息，并将 max_tokens 限制在模型允许范围内"""
+        # 检查并截断消息以适应 token 限制
+        messages = self._fit_input_limit(messages)
+        
+        # 限制max_tokens在DeepSeek允许的范围内
+        if max_tokens is not None and max_tokens > self.MAX_OUTPUT_TOKENS:
+            logger.warning(f"Requested max_tokens ({max_tokens}) exceeds model's MAX_OUTPUT_TOKENS ({self.MAX_OUTPUT_TOKENS}). Clamping to {self.MAX_OUTPUT_TOKENS}.")
+            max_tokens = self.MAX_OUTPUT_TOKENS
+        elif max_tokens is not None and max_tokens < 1: # Ensure at least some tokens are requested for output
+            logger.warning(f"Requested max_tokens ({max_tokens}) is invalid. Setting to a minimum of 100.")
+            max_tokens = 100 # A small reasonable minimum
+        
+        return await self.client.chat.completions.create(
+            model=self.config.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            **params
+        )
+    
+    def _response_cache_key(
+        self,
+        messages: List[Dict[str, Any]],
+        response_model: Type[BaseModel],
+        max_tokens: Optional[int],
+        temperature: float
+    ) -> Optional[str]:
+        """结构化请求的缓存键（模型、消息、响应模型、max_tokens 和温度的摘要），消息无法序列化时返回 None"""
+        try:
+            payload = orjson.dumps([
+                self.config.model,
+                messages,
+                f"{response_model.__module__}.{response_model.__qualname__}",
+                max_tokens,
+                temperature,
+            ])
+        except TypeError:
+            return None
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+    
+    def _cache_response(self, cache_key: Optional[str], result: BaseModel) -> None:
+        """缓存完整且通过校验的结构化响应（存为 model_dump 字典，命中时重新构建实例）"""
+        if cache_key is None:
+            return
+        self._response_cache[cache_key] = result.model_dump()
+        if len(self._response_cache) > RESPONSE_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
     
     async def _create_structured_completion(
         self,
@@ -134,56 +382,43 @@ class DeepSeekClient(OpenAIClient):
     ) -> BaseModel:
         """重写结构化完成方法，使用标准 JSON 模式而不是 beta API"""
         try:
-            # 添加系统提示，要求以 JSON 格式返回
-            json_schema = response_model.model_json_schema()
-            system_prompt = f"""
-请严格按照以下 JSON Schema 格式返回结果，不要包含任何其他文本：
-
-Schema:
-{json.dumps(json_schema, indent=2, ensure_ascii=False)}
-
-要求：
-1. 返回有效的 JSON 格式
-2. 严格遵循 schema 结构
-3. 不要添加任何解释或其他文本
-4. 确保所有必需字段都存在
-5. 如果没有找到相关内容，返回空数组而不是省略字段
-"""
-            
-            # 修改消息，添加系统提示
-            modified_messages = [
-                {"role": "system", "content": system_prompt}
-            ] + messages
+            # 添加系统提示，要求以 JSON 格式返回（按模型类缓存）
+            system_prompt, default_factories = _build_system_prompt(response_model)
             
-            # 检查并截断消息以适应 token 限制
-            total_tokens = self._count_messages_tokens(modified_messages)
-            logger.info(f"请求 token 数量: {total_tokens}")
-            
-            if total_tokens > self.MAX_INPUT_TOKENS:
-                logger.warning(f"Token 数量超限 ({total_tokens} > {self.MAX_INPUT_TOKENS})，开始截断...")
-                modified_messages = self._truncate_messages(modified_messages, self.MAX_INPUT_TOKENS)
-                final_tokens = self._count_messages_tokens(modified_messages)
-                logger.info(f"截断后 token 数量: {final_tokens}")
+            # 修改消息，添加系统提示：已有系统消息时追加到其内容中，避免再发送一条系统消息
+            modified_messages = list(messages)
+            for index, message in enumerate(modified_messages):
+                if message.get("role") == "system":
+                    modified_messages[index] = {
+                        **message,
+                        "content": f"{message.get('content') or ''}\n\n{system_prompt}"
+                    }
+                    break
+            else:
+                modified_messages.insert(0, {"role": "system", "content": system_prompt})
             
-            # 限制max_tokens在DeepSeek允许的范围内
             # Default max_tokens for completion, can be overridden by kwargs
             default_completion_max_tokens = 2000
             max_tokens = kwargs.get("max_tokens", default_completion_max_tokens)
-
-            if max_tokens and max_tokens > self.MAX_OUTPUT_TOKENS:
-                logger.warning(f"Requested max_tokens ({max_tokens}) exceeds model's MAX_OUTPUT_TOKENS ({self.MAX_OUTPUT_TOKENS}). Clamping to {self.MAX_OUTPUT_TOKENS}.")
-                max_tokens = self.MAX_OUTPUT_TOKENS
-            elif max_tokens and max_tokens < 1: # Ensure at least some tokens are requested for output
-                logger.warning(f"Requested max_tokens ({max_tokens}) is invalid. Setting to a minimum of 100.")
-                max_tokens = 100 # A small reasonable minimum
+            temperature = kwargs.get("temperature", 0.1)
+            
+            # 低温度请求的输出基本确定，命中缓存时直接返回
+            cache_key = None
+            if temperature <= RESPONSE_CACHE_MAX_TEMPERATURE:
+                cache_key = self._response_cache_key(messages, response_model, max_tokens, temperature)
+                cached = self._response_cache.get(cache_key) if cache_key else None
+                if cached is not None:
+                    self._response_cache.move_to_end(cache_key)
+                    logger.debug(f"结构化响应缓存命中: {response_model.__name__}")
+                    # 每次命中都构建新实例，调用方修改返回结果不会影响缓存
+                    return response_model.model_validate(cached)
             
-            # 使用标准的 chat completions API
-            response = await self.client.chat.completions.create(
-                model=self.config.model,
-                messages=modified_messages,
+            # 使用标准的 chat completions API（JSON 模式）
+            response = await self._make_chat_completion(
+                modified_messages,
+                max_tokens=max_tokens,
                 response_format={"type": "json_object"},
-                temperature=kwargs.get("temperature", 0.1),
-                max_tokens=max_tokens
+                temperature=temperature
             )
             
             # 解析响应
@@ -198,77 +433,45 @@ Schema:
             else:
                 logger.error("DeepSeek 响应无效、无有效选项或消息对象为空.")
 
+            if api_content:
+                try:
+                    # 响应是完整且符合 schema 的 JSON 时，由 pydantic-core 一次完成解析和校验
+                    result = response_model.model_validate_json(api_content)
+                    logger.debug(f"Pydantic 模型成功创建: {result}")
+                    self._cache_response(cache_key, result)
+                    return result
+                except ValidationError:
+                    # 缺少必需字段或内容不是纯 JSON，交给下面的兼容解析
+                    pass
+
             parsed_json_data = None
             if api_content:
                 try:
                     # 尝试直接解析JSON
-                    parsed_json_data = json.loads(api_content)
-                except json.JSONDecodeError as e:
+                    parsed_json_data = orjson.loads(api_content)
+                except orjson.JSONDecodeError as e:
                     logger.warning(f"直接JSON解析失败: {e}. 尝试从内容中提取JSON.")
-                    import re
-                    # 尝试从 ```json ... ``` 或 ``` ... ``` 中提取
-                    match = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", api_content, re.DOTALL)
-                    if match:
-                        extracted_json_str = match.group(1)
-                        logger.info(f"从Markdown代码块中提取的JSON字符串: {extracted_json_str}")
-                        try:
-                            parsed_json_data = json.loads(extracted_json_str)
-                            logger.info("从提取的JSON字符串解析成功.")
-                        except json.JSONDecodeError as e_inner_md:
-                            logger.error(f"从Markdown提取的JSON解析失败: {e_inner_md}")
-                            parsed_json_data = None # Ensure it's None
-
-                    if parsed_json_data is None: # If markdown extraction didn't work or wasn't applicable
-                        # 尝试宽松的 regex 匹配 (原始的 r'\{.*\}')
-                        json_match_loose = re.search(r'\{.*\}', api_content, re.DOTALL)
-                        if json_match_loose:
-                            logger.info(f"尝试使用宽松的 regex 进行JSON提取.")
-                            try:
-                                parsed_json_data = json.loads(json_match_loose.group(0))
-                                logger.info("宽松的JSON提取和解析成功.")
-                            except json.JSONDecodeError as e_inner_loose:
-                                logger.error(f"宽松提取的JSON解析失败: {e_inner_loose}")
-                                parsed_json_data = None # Ensure it's None
-                            except Exception as e_gen_loose_inner:
-                                logger.error(f"宽松提取的JSON解析时发生未知错误: {e_gen_loose_inner}")
-                                parsed_json_data = None # Ensure it's None
-                        else:
-                            logger.warning("在响应中未找到宽松匹配的JSON格式子字符串.")
+                    # 从 Markdown 代码块或夹杂说明文字的内容中提取第一个完整的 JSON 对象
+                    parsed_json_data = _extract_first_json(api_content)
+                    if parsed_json_data is not None:
+                        logger.info("从响应内容中提取JSON并解析成功.")
+                    else:
+                        logger.warning("在响应中未找到可解析的JSON对象.")
                 except Exception as e_outer:
                     # Catch any other unexpected error during parsing attempts
                     logger.error(f"解析API内容时发生意外错误: {e_outer}")
                     parsed_json_data = None
 
-            # 获取 schema 定义以备后用
-            schema_properties = json_schema.get("properties", {})
-            required_fields = json_schema.get("required", [])
-
             if parsed_json_data is not None:
                 try:
-                    # 验证必需字段并提供默认值
-                    for field in required_fields:
-                        if field not in parsed_json_data:
-                            field_schema = schema_properties.get(field, {})
-                            field_type = field_schema.get("type", "string")
-                            # Provide default values based on type
-                            if field_type == "array":
-                                parsed_json_data[field] = []
-                            elif field_type == "object":
-                                parsed_json_data[field] = {}
-                            elif field_type == "string":
-                                parsed_json_data[field] = ""
-                            elif field_type == "number":
-                                parsed_json_data[field] = 0 # Or 0.0 if appropriate
-                            elif field_type == "integer":
-                                parsed_json_data[field] = 0
-                            elif field_type == "boolean":
-                                parsed_json_data[field] = False
-                            else:
-                                # For other types, or if type is not specified, use None
-                                parsed_json_data[field] = None
+                    # 验证必需字段并按类型提供默认值（通常没有缺失，先做一次集合差集判断）
+                    missing_fields = default_factories.keys() - parsed_json_data.keys()
+                    for field in missing_fields:
+                        parsed_json_data[field] = default_factories[field]()
                     
-                    result = response_model(**parsed_json_data)
+                    result = response_model.model_validate(parsed_json_data)
                     logger.debug(f"Pydantic 模型成功创建: {result}")
+                    # 补过默认值或从杂乱内容中提取的结果可能不完整，不缓存
                     return result
                 except Exception as e_pydantic:
                     logger.error(f"使用API响应创建Pydantic模型失败: {e_pydantic}. 将使用默认值.")
@@ -279,51 +482,21 @@ Schema:
                 f"无法从API响应中解析JSON或创建模型失败. "
                 f"将为 {response_model.__name__} 使用默认值."
             )
-            default_data = {}
-            for field in required_fields:
-                field_schema = schema_properties.get(field, {})
-                field_type = field_schema.get("type", "string")
-                if field_type == "array":
-                    default_data[field] = []
-                elif field_type == "object":
-                    default_data[field] = {}
-                elif field_type == "string":
-                    default_data[field] = ""
-                elif field_type == "number":
-                    default_data[field] = 0 # Or 0.0
-                elif field_type == "integer":
-                    default_data[field] = 0
-                elif field_type == "boolean":
-                    default_data[field] = False
-                else:
-                    default_data[field] = None
+            default_data = {field: default_factory() for field, default_factory in default_factories.items()}
 
             # For any fields not in 'required' but in 'properties',
             # Pydantic will use their default values if defined in the model, or raise error if required and no default.
             # Our loop above only ensures 'required' fields get a basic default if missing from JSON.
-            return response_model(**default_data)
+            return response_model.model_validate(default_data)
                 
         except Exception as e:
             logger.error(f"DeepSeek 结构化完成失败: {e}")
             # 返回带有默认值的实例
             try:
-                json_schema = response_model.model_json_schema()
-                default_data = {}
-                schema_properties = json_schema.get("properties", {})
-                required_fields = json_schema.get("required", [])
+                _, default_factories = _build_system_prompt(response_model)
+                default_data = {field: default_factory() for field, default_factory in default_factories.items()}
                 
-                for field in required_fields:
-                    field_schema = schema_properties.get(field, {})
-                    field_type = field_schema.get("type", "string")
-                    
-                    if field_type == "array":
-                        default_data[field] = []
-                    elif field_type == "object":
-                        default_data[field] = {}
-                    else:
-                        default_data[field] = ""
-                
-                return response_model(**default_data)
+                return response_model.model_validate(default_data)
             except:
                 return response_model()
     
@@ -343,30 +516,14 @@ Schema:
             # 将Pydantic模型转换为字典
             return pydantic_result.model_dump()
         else:
-            # 标准文本生成 - 也需要检查 token 限制
-            total_tokens = self._count_messages_tokens(messages)
-            if total_tokens > self.MAX_INPUT_TOKENS:
-                logger.warning(f"标准生成 Token 数量 ({total_tokens}) 超限 ({self.MAX_INPUT_TOKENS})，开始截断...")
-                messages = self._truncate_messages(messages, self.MAX_INPUT_TOKENS)
-                logger.info(f"标准生成截断后 token 数量: {self._count_messages_tokens(messages)}")
-            
+            # 标准文本生成
             # Use the provided max_tokens or a default, ensuring it's within model limits
             default_text_gen_max_tokens = 1000 # Default for standard text generation
-            current_max_tokens = max_tokens if max_tokens is not None else default_text_gen_max_tokens
-
-            if current_max_tokens > self.MAX_OUTPUT_TOKENS:
-                logger.warning(f"Requested max_tokens ({current_max_tokens}) for standard generation exceeds model's MAX_OUTPUT_TOKENS ({self.MAX_OUTPUT_TOKENS}). Clamping to {self.MAX_OUTPUT_TOKENS}.")
-                current_max_tokens = self.MAX_OUTPUT_TOKENS
-            elif current_max_tokens < 1:
-                logger.warning(f"Requested max_tokens ({current_max_tokens}) for standard generation is invalid. Setting to a minimum of 100.")
-                current_max_tokens = 100 # A small reasonable minimum
-            
             try:
-                response = await self.client.chat.completions.create(
-                    model=self.config.model,
-                    messages=messages,
-                    temperature=0.7, # Default temperature for text generation
-                    max_tokens=current_max_tokens
+                response = await self._make_chat_completion(
+                    messages,
+                    max_tokens=max_tokens if max_tokens is not None else default_text_gen_max_tokens,
+                    temperature=0.7 # Default temperature for text generation
                 )
                 # Check if response and choices are valid before accessing content
                 if response and response.choices and response.choices[0].message:
@@ -377,8 +534,3 @@ Schema:
             except Exception as e:
                 logger.error(f"Error during DeepSeek standard generation: {e}", exc_info=True)
                 return {"content": None, "error": str(e)}
-                messages=messages,
-                temperature=0.7,
-                max_tokens=max_tokens
-            )
-            return {"content": response.choices[0].message.content}
\ No newline at end of file
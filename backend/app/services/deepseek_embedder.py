@@ -3,12 +3,36 @@
 自定义 DeepSeek 嵌入客户端
 """
 
+import asyncio
+import hashlib
 import logging
 from typing import List
+import numpy as np
 from graphiti_core.embedder.client import EmbedderClient
 
 logger = logging.getLogger(__name__)
 
+# 批量文本数达到该值时在线程池中计算嵌入（小批量直接计算，线程切换开销反而更大）
+EMBED_IN_THREAD_MIN_TEXTS = 256
+
+
+def _hash_digest(text: str, embedding_dim: int) -> bytes:
+    """用可扩展输出的 SHAKE128 为文本生成恰好 embedding_dim 个 float32 长度的摘要"""
+    return hashlib.shake_128(text.encode('utf-8')).digest(embedding_dim * 4)
+
+
+def _digests_to_embeddings(digests: List[bytes], embedding_dim: int) -> np.ndarray:
+    """将哈希摘要批量转换为伪嵌入矩阵（每行一个文本），摘要按 float32 解释并缩放、截断到 [-1, 1]"""
+    raw = np.frombuffer(b"".join(digests), dtype=np.float32).reshape(len(digests), embedding_dim)
+    # 随机字节可能解释为 NaN/inf，属预期情况，不发出浮点警告
+    with np.errstate(invalid="ignore", over="ignore"):
+        embeddings = np.divide(raw, 1e10, dtype=np.float64)
+    # 标准化到 [-1, 1] 范围（NaN 按 1.0 处理）
+    np.nan_to_num(embeddings, copy=False, nan=1.0)
+    np.clip(embeddings, -1.0, 1.0, out=embeddings)
+    return embeddings
+
+
 class DeepSeekEmbedder(EmbedderClient):
     """简化的嵌入客户端，避免调用OpenAI API"""
     
@@ -33,40 +57,28 @@ class DeepSeekEmbedder(EmbedderClient):
     
     async def embed_text(self, text: str) -> List[float]:
         """生成文本的嵌入向量（简化实现）"""
-        # 使用简单的哈希方法生成固定长度的向量
-        # 这是一个占位符实现，避免调用外部API
-        import hashlib
-        import struct
-        
         # 使用文本的哈希值生成伪嵌入向量
-        hash_obj = hashlib.sha256(text.encode('utf-8'))
-        hash_bytes = hash_obj.digest()
-        
-        # 将哈希字节转换为浮点数向量
-        embedding = []
-        for i in range(0, min(len(hash_bytes), self.embedding_dim * 4), 4):
-            if i + 4 <= len(hash_bytes):
-                float_val = struct.unpack('f', hash_bytes[i:i+4])[0]
-                # 标准化到 [-1, 1] 范围
-                float_val = max(-1.0, min(1.0, float_val / 1e10))
-                embedding.append(float_val)
-        
-        # 填充到目标维度
-        while len(embedding) < self.embedding_dim:
-            embedding.append(0.0)
-        
-        # 截断到目标维度
-        embedding = embedding[:self.embedding_dim]
+        # 这是一个占位符实现，避免调用外部API
+        digest = _hash_digest(text, self.embedding_dim)
+        embedding = _digests_to_embeddings([digest], self.embedding_dim)[0].tolist()
         
         logger.debug(f"生成嵌入向量，文本长度: {len(text)}, 向量维度: {len(embedding)}")
         return embedding
     
+    def _embed_texts_sync(self, texts: List[str]) -> List[List[float]]:
+        """批量生成嵌入向量（同步计算）：所有文本的摘要拼成一个矩阵，一次完成缩放和截断"""
+        digests = [_hash_digest(text, self.embedding_dim) for text in texts]
+        return _digests_to_embeddings(digests, self.embedding_dim).tolist()
+    
     async def embed_texts(self, texts: List[str]) -> List[List[float]]:
         """批量生成文本的嵌入向量"""
-        embeddings = []
-        for text in texts:
-            embedding = await self.embed_text(text)
-            embeddings.append(embedding)
+        if not texts:
+            return []
+        if len(texts) >= EMBED_IN_THREAD_MIN_TEXTS:
+            # 大批量放到线程池中整体计算，避免阻塞事件循环
+            embeddings = await asyncio.to_thread(self._embed_texts_sync, texts)
+        else:
+            embeddings = self._embed_texts_sync(texts)
         
         logger.debug(f"批量生成嵌入向量，文本数量: {len(texts)}")
         return embeddings
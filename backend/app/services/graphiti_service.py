@@ -6,7 +6,10 @@ import os
 import logging
 import asyncio
 import re
-from typing import Optional, Dict, Any, List
+import time
+import orjson
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime
 from pydantic import BaseModel
 from pathlib import Path
@@ -33,11 +36,18 @@ class SearchResult(BaseModel):
     relationships: List[Dict[str, Any]]
     total_count: int
 
+# 搜索结果 LRU 缓存的最大条目数
+SEARCH_CACHE_SIZE = 512
+# 搜索结果缓存的有效期（秒）；其他进程写入图谱时，本进程的缓存最多过期这么久
+SEARCH_CACHE_TTL = 30.0
+
 class GraphitiService:
     """Graphiti 知识图谱服务"""
     
     def __init__(self):
         self.client: Optional[Graphiti] = None
+        # (query, limit) -> (过期时间, 成功的搜索结果)；本进程写入图谱时清空
+        self._search_cache: "OrderedDict[Tuple[str, int], Tuple[float, Dict[str, Any]]]" = OrderedDict()
         self._initialize_client()
     
     def _initialize_client(self):
@@ -121,6 +131,10 @@ class GraphitiService:
     def is_available(self) -> bool:
         """检查 Graphiti 是否可用"""
         return self.client is not None
+
+    def clear_search_cache(self):
+        """清空搜索结果缓存"""
+        self._search_cache.clear()
     
     async def build_knowledge_graph(self, text: str, document_id: str) -> Dict[str, Any]:
         """构建知识图谱"""
@@ -223,9 +237,12 @@ class GraphitiService:
                 "node_count": 0,
                 "edge_count": 0
             }
+        finally:
+            # 即使构建中途失败也可能已写入部分节点，缓存的搜索结果一律作废
+            self.clear_search_cache()
     
-    async def search_knowledge(self, query: str, limit: int = 10) -> Dict[str, Any]:
-        """搜索知识图谱"""
+    async def search_knowledge(self, query: str, limit: int = 10, use_cache: bool = True) -> Dict[str, Any]:
+        """搜索知识图谱（相同查询在缓存有效期内命中 LRU 缓存时不再访问图数据库）"""
         if not self.is_available():
             return {
                 "success": False,
@@ -235,6 +252,17 @@ class GraphitiService:
                 "total_count": 0
             }
         
+        cache_key = (query, limit)
+        if use_cache:
+            cached = self._search_cache.get(cache_key)
+            if cached is not None:
+                expires, cached_result = cached
+                if time.monotonic() < expires:
+                    self._search_cache.move_to_end(cache_key)
+                    logger.info(f"🔍 搜索缓存命中: {query}")
+                    return cached_result
+                del self._search_cache[cache_key]
+        
         try:
             logger.info(f"🔍 搜索知识图谱: {query}")
             
@@ -269,12 +297,17 @@ class GraphitiService:
                         "type": "search_result"
                     })
             
-            return {
+            result = {
                 "success": True,
                 "entities": entities,
                 "relationships": relationships,
                 "total_count": len(search_results)
             }
+            self._search_cache[cache_key] = (time.monotonic() + SEARCH_CACHE_TTL, result)
+            self._search_cache.move_to_end(cache_key)
+            if len(self._search_cache) > SEARCH_CACHE_SIZE:
+                self._search_cache.popitem(last=False)
+            return result
             
         except Exception as e:
             logger.error(f"❌ 知识图谱搜索失败: {e}")
@@ -1241,7 +1274,7 @@ async def get_entity_relationships(
 async def export_knowledge_corpus(
     group_id: Optional[str] = None,
     format_type: str = "jsonl"
-) -> str:
+) -> Tuple[str, int]:
     """
     导出知识图谱作为训练语料
     
@@ -1250,7 +1283,7 @@ async def export_knowledge_corpus(
         format_type: 导出格式 (jsonl, txt, csv)
         
     Returns:
-        str: 导出文件路径
+        Tuple[str, int]: 导出文件路径和写入的记录数
     """
     actual_group_id = group_id or get_settings().GRAPHITI_GROUP_ID
     
@@ -1272,16 +1305,18 @@ async def export_knowledge_corpus(
         logger.error(f"导出知识语料失败: {str(e)}")
         raise
 
-async def _export_jsonl(search_result: SearchResult, group_id: str) -> str:
+EXPORT_BUFFER_SIZE = 256 * 1024
+
+async def _export_jsonl(search_result: SearchResult, group_id: str) -> Tuple[str, int]:
     """导出为 JSONL 格式"""
-    import json
-    
     output_file = f"exports/knowledge_corpus_{group_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
     
     # 确保导出目录存在
     Path(output_file).parent.mkdir(parents=True, exist_ok=True)
     
-    with open(output_file, 'w', encoding='utf-8') as f:
+    record_count = 0
+    # 二进制写入 + 大缓冲区，orjson 直接输出 UTF-8 字节
+    with open(output_file, 'wb', buffering=EXPORT_BUFFER_SIZE) as f:
         for entity in search_result.entities:
             # 转换为训练格式
             corpus_item = {
@@ -1290,25 +1325,29 @@ async def _export_jsonl(search_result: SearchResult, group_id: str) -> str:
                 "domain": "bridge_engineering",
                 "source": "knowledge_graph"
             }
-            f.write(json.dumps(corpus_item, ensure_ascii=False) + '\n')
+            f.write(orjson.dumps(corpus_item, option=orjson.OPT_APPEND_NEWLINE))
+            record_count += 1
     
-    return output_file
+    return output_file, record_count
 
-async def _export_txt(search_result: SearchResult, group_id: str) -> str:
+async def _export_txt(search_result: SearchResult, group_id: str) -> Tuple[str, int]:
     """导出为文本格式"""
     output_file = f"exports/knowledge_corpus_{group_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
     
     Path(output_file).parent.mkdir(parents=True, exist_ok=True)
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for entity in search_result.entities:
-            f.write(f"实体: {entity.get('name', '')}\n")
-            f.write(f"描述: {entity.get('summary', '')}\n")
-            f.write("=" * 50 + "\n")
+    entities = search_result.entities
+    separator = "=" * 50
+    with open(output_file, 'w', encoding='utf-8', buffering=EXPORT_BUFFER_SIZE) as f:
+        # 每个实体拼成一条记录，由 writelines 批量写出
+        f.writelines(
+            f"实体: {entity.get('name', '')}\n描述: {entity.get('summary', '')}\n{separator}\n"
+            for entity in entities
+        )
     
-    return output_file
+    return output_file, len(entities)
 
-async def _export_csv(search_result: SearchResult, group_id: str) -> str:
+async def _export_csv(search_result: SearchResult, group_id: str) -> Tuple[str, int]:
     """导出为 CSV 格式"""
     import csv
     
@@ -1316,19 +1355,18 @@ async def _export_csv(search_result: SearchResult, group_id: str) -> str:
     
     Path(output_file).parent.mkdir(parents=True, exist_ok=True)
     
-    with open(output_file, 'w', newline='', encoding='utf-8') as f:
+    entities = search_result.entities
+    with open(output_file, 'w', newline='', encoding='utf-8', buffering=EXPORT_BUFFER_SIZE) as f:
         writer = csv.writer(f)
         writer.writerow(['entity_name', 'summary', 'domain', 'source'])
         
-        for entity in search_result.entities:
-            writer.writerow([
-                entity.get('name', ''),
-                entity.get('summary', ''),
-                'bridge_engineering',
-                'knowledge_graph'
-            ])
+        # writerows 在 C 层循环写出所有行
+        writer.writerows(
+            (entity.get('name', ''), entity.get('summary', ''), 'bridge_engineering', 'knowledge_graph')
+            for entity in entities
+        )
     
-    return output_file
+    return output_file, len(entities)
 
 # 全局服务实例
 graphiti_service: Optional[GraphitiService] = None
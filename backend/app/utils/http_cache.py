@@ -0,0 +1,25 @@
+"""
+HTTP 缓存工具
+为轮询频繁的列表接口生成 ETag，内容未变化时返回 304
+"""
+import hashlib
+from typing import Any
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+
+def etag_json_response(request: Request, content: Any) -> Response:
+    """序列化为 JSON 并附带 ETag；与 If-None-Match 匹配时返回 304（无响应体）"""
+    body = orjson.dumps(content)
+    etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in candidates or "*" in candidates:
+            return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,14 @@
+"""
+基于 orjson 的 JSON 响应
+"""
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class OrjsonResponse(JSONResponse):
+    """使用 orjson 序列化的 JSONResponse（支持非字符串键）"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
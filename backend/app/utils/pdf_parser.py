@@ -18,6 +18,9 @@ from pydantic import BaseModel
 
 logger = logging.getLogger(__name__)
 
+# 非有效字符（中文、英文字母、数字以外）的连续片段
+_NON_VALID_CHARS_RE = re.compile(r'[^\u4e00-\u9fffa-zA-Z0-9]+')
+
 class PDFContent(BaseModel):
     """PDF 内容数据结构"""
     text: str = ""
@@ -209,10 +212,8 @@ class PDFParser:
         
         # 检查有效字符比例
         if text_length > 0:
-            chinese_chars = len(re.findall(r'[\u4e00-\u9fff]', clean_text))
-            english_chars = len(re.findall(r'[a-zA-Z]', clean_text))
-            numbers = len(re.findall(r'[0-9]', clean_text))
-            valid_chars = chinese_chars + english_chars + numbers
+            # 删除无效字符后剩余的长度即有效字符数，单次扫描且不生成匹配列表
+            valid_chars = len(_NON_VALID_CHARS_RE.sub('', clean_text))
             
             valid_ratio = valid_chars / text_length
             logger.info(f"📊 有效字符比例: {valid_ratio:.2f}")
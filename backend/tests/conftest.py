@@ -0,0 +1,11 @@
+"""
+测试公共配置
+"""
+import os
+import sys
+
+# 测试在 backend 目录外运行时也能导入 app 包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 配置中的必填项，测试环境下给出占位值
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
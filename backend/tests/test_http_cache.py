@@ -0,0 +1,62 @@
+"""
+列表接口 HTTP 缓存测试
+"""
+import warnings
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.utils.http_cache import etag_json_response
+
+
+def _make_client(payload):
+    app = FastAPI()
+
+    @app.get("/list")
+    @app.head("/list", include_in_schema=False)
+    async def list_items(request: Request):
+        return etag_json_response(request, payload)
+
+    return TestClient(app)
+
+
+def test_etag_returns_304_when_unchanged():
+    client = _make_client({"files": [1, 2, 3]})
+    first = client.get("/list")
+    assert first.status_code == 200
+    assert first.json() == {"files": [1, 2, 3]}
+    etag = first.headers["etag"]
+
+    second = client.get("/list", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["etag"] == etag
+
+    # 弱校验形式与多值列表同样命中
+    weak = client.get("/list", headers={"If-None-Match": f'"other", W/{etag}'})
+    assert weak.status_code == 304
+
+    head = client.head("/list", headers={"If-None-Match": etag})
+    assert head.status_code == 304
+
+
+def test_etag_returns_body_when_changed():
+    client = _make_client({"files": []})
+    response = client.get("/list", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+    assert response.json() == {"files": []}
+
+
+def test_openapi_operation_ids_are_unique():
+    main = pytest.importorskip("app.main")
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")  # 重复的 operationId 会触发 UserWarning
+        schema = main.app.openapi()
+
+    operation_ids = [
+        operation["operationId"]
+        for path_item in schema["paths"].values()
+        for operation in path_item.values()
+    ]
+    assert len(operation_ids) == len(set(operation_ids))